@@ -0,0 +1,172 @@
+"""Writes synthetic Cisco config.dump trees for benchmarking.
+
+Example:
+    python -m bench.generate --topology leaf-spine --devices 1000 --out /tmp/configs \
+        --duplicate-ips 5 --mtu-mismatches 5 --traffic-pairs 10000
+"""
+import argparse
+import os
+import random
+from ipaddress import IPv4Address
+import networkx as nx
+
+TOPOLOGIES = ['ring', 'leaf-spine', 'mesh']
+
+LINK_POOL = int(IPv4Address('10.0.0.0'))   # One /30 per link
+LAN_POOL = int(IPv4Address('100.64.0.0'))  # One /28 LAN per device
+LINK_BANDWIDTHS = [100000, 1000000, 10000000]  # kbps
+
+def build_graph(kind, devices, seed=0):
+    """Returns an undirected graph of integer device ids shaped like the given topology."""
+    rng = random.Random(seed)
+    if kind == 'ring':
+        return nx.cycle_graph(devices)
+    if kind == 'leaf-spine':
+        # A handful of spines, each connected to every leaf
+        spines = max(2, min(16, devices // 32))
+        G = nx.Graph()
+        G.add_nodes_from(range(devices))
+        G.add_edges_from((spine, leaf) for spine in range(spines) for leaf in range(spines, devices))
+        return G
+    if kind == 'mesh':
+        # A random spanning tree plus as many random extra links again, so it stays connected
+        G = nx.Graph()
+        G.add_nodes_from(range(devices))
+        for node in range(1, devices):
+            G.add_edge(node, rng.randrange(node))
+        for _ in range(devices):
+            u, v = rng.randrange(devices), rng.randrange(devices)
+            if u != v:
+                G.add_edge(u, v)
+        return G
+    raise ValueError(f"Unknown topology: {kind}")
+
+def hostname(node):
+    return f"R{node + 1}"
+
+def plan_interfaces(graph, seed=0):
+    """Assigns every device a LAN interface and one /30 interface per link.
+
+    Returns {node: [interface dict]} where each dict has name, ip, mask,
+    bandwidth, mtu and, for link interfaces, the peer's IP.
+    """
+    rng = random.Random(seed)
+    plan = {}
+    for node in graph.nodes():
+        lan = LAN_POOL + node * 16
+        plan[node] = [{'name': 'GigabitEthernet0/0', 'ip': str(IPv4Address(lan + 1)), 'mask': '255.255.255.240',
+                       'bandwidth': 1000000, 'mtu': 1500, 'peer_ip': None}]
+    for k, (u, v) in enumerate(graph.edges()):
+        base = LINK_POOL + k * 4
+        bandwidth = rng.choice(LINK_BANDWIDTHS)
+        for node, ip, peer_ip in ((u, base + 1, base + 2), (v, base + 2, base + 1)):
+            plan[node].append({'name': f"GigabitEthernet1/{len(plan[node]) - 1}", 'ip': str(IPv4Address(ip)),
+                               'mask': '255.255.255.252', 'bandwidth': bandwidth, 'mtu': 1500,
+                               'peer_ip': str(IPv4Address(peer_ip))})
+    return plan
+
+def inject_faults(plan, duplicate_ips=0, mtu_mismatches=0, seed=0):
+    """Copies link IPs onto other devices' LANs and changes one side's MTU on random links.
+
+    Returns (duplicates, mismatches) naming the devices that were modified.
+    """
+    rng = random.Random(seed)
+    nodes = sorted(plan)
+    duplicates, mismatches = [], []
+    # Link interfaces in random order; each fault takes the next one whose /30 or /28 is still untouched
+    links = [(node, interface) for node in nodes for interface in plan[node][1:]]
+    rng.shuffle(links)
+
+    # Only point-to-point addresses are copied: a LAN address brings its /28 along, so the target would
+    # share the source's subnet and gain a link to it rather than just a clashing address
+    targets = rng.sample(nodes, len(nodes))
+    blocks = set()
+    for source, interface in links:
+        if len(duplicates) == min(duplicate_ips, len(nodes) // 2):
+            break
+        # The target keeps its /28 mask, so two copies from one /28 would put their targets on a shared subnet
+        block = int(IPv4Address(interface['ip'])) >> 4
+        target = next((node for node in targets if node != source), None)
+        if block in blocks or target is None:
+            continue
+        blocks.add(block)
+        targets.remove(target)
+        plan[target][0]['ip'] = interface['ip']
+        duplicates.append((hostname(source), hostname(target)))
+
+    # One side of each chosen link, so a second toggle can't undo a mismatch
+    subnets = set()
+    for node, interface in links:
+        if len(mismatches) == mtu_mismatches:
+            break
+        subnet = int(IPv4Address(interface['ip'])) >> 2
+        if subnet in subnets:
+            continue
+        subnets.add(subnet)
+        interface['mtu'] = 9000 if interface['mtu'] == 1500 else 1500
+        mismatches.append((hostname(node), interface['name']))
+    return duplicates, mismatches
+
+def render_config(node, interfaces):
+    """Renders one device's interfaces as Cisco IOS config text."""
+    lines = ['!', f"hostname {hostname(node)}", '!']
+    for interface in interfaces:
+        lines.append(f"interface {interface['name']}")
+        description = 'LAN' if interface['peer_ip'] is None else f"Link to {interface['peer_ip']}"
+        lines.append(f" description {description}")
+        lines.append(f" ip address {interface['ip']} {interface['mask']}")
+        lines.append(f" bandwidth {interface['bandwidth']}")
+        lines.append(f" mtu {interface['mtu']}")
+        lines.append('!')
+    # Point the default route at the first link's peer, which is on a connected subnet
+    peers = [interface['peer_ip'] for interface in interfaces if interface['peer_ip']]
+    if peers:
+        lines.append(f"ip route 0.0.0.0 0.0.0.0 {peers[0]}")
+        lines.append('!')
+    return '\n'.join(lines) + '\n'
+
+def write_configs(plan, out_dir):
+    """Writes <out_dir>/<hostname>/config.dump for every device in the plan."""
+    for node, interfaces in plan.items():
+        device_dir = os.path.join(out_dir, hostname(node))
+        os.makedirs(device_dir, exist_ok=True)
+        with open(os.path.join(device_dir, 'config.dump'), 'w') as f:
+            f.write(render_config(node, interfaces))
+
+def write_traffic_matrix(graph, path, pairs, seed=0, max_demand=10000):
+    """Writes a CSV traffic matrix of random source/target demands in kbps."""
+    rng = random.Random(seed)
+    nodes = list(graph.nodes())
+    with open(path, 'w') as f:
+        f.write('source,target,demand\n')
+        for _ in range(pairs):
+            source, target = rng.sample(nodes, 2)
+            f.write(f"{hostname(source)},{hostname(target)},{rng.randint(1, max_demand)}\n")
+
+def generate(kind, devices, out_dir, duplicate_ips=0, mtu_mismatches=0, traffic_pairs=0, seed=0):
+    """Generates a full config tree (and optionally a traffic matrix) and returns its graph."""
+    graph = build_graph(kind, devices, seed)
+    plan = plan_interfaces(graph, seed)
+    inject_faults(plan, duplicate_ips, mtu_mismatches, seed)
+    write_configs(plan, out_dir)
+    if traffic_pairs:
+        write_traffic_matrix(graph, os.path.join(out_dir, 'traffic.csv'), traffic_pairs, seed)
+    return graph
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic router config trees")
+    parser.add_argument('--topology', choices=TOPOLOGIES, default='ring')
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--out', required=True, help="Directory to write <hostname>/config.dump files into.")
+    parser.add_argument('--duplicate-ips', type=int, default=0)
+    parser.add_argument('--mtu-mismatches', type=int, default=0)
+    parser.add_argument('--traffic-pairs', type=int, default=0, help="Also write <out>/traffic.csv with this many demands.")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    graph = generate(args.topology, args.devices, args.out, args.duplicate_ips, args.mtu_mismatches,
+                     args.traffic_pairs, args.seed)
+    print(f"Wrote {graph.number_of_nodes()} devices and {graph.number_of_edges()} links to {args.out}")
+
+if __name__ == "__main__":
+    main()
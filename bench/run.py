@@ -0,0 +1,160 @@
+"""Times each main.py stage on generated networks and compares against a stored baseline.
+
+Example:
+    python -m bench.run --topology ring --sizes 100,1000 --save-baseline bench/baseline.json
+    python -m bench.run --topology ring --sizes 100,1000 --baseline bench/baseline.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+try:
+    import resource
+except ImportError: # Unix only; max RSS is reported as null elsewhere
+    resource = None
+from bench.generate import TOPOLOGIES, generate
+from src.instrument import quiet_logging
+from src.parser import parse_config_files
+from src.topology import create_topology
+from src.validator import run_validation_checks
+from src.analyzer import load_traffic_matrix, run_load_analysis, run_failure_analysis
+from src.simulator.virtual_engine import VirtualSimulationEngine
+
+STAGES = ['parse', 'topology', 'validate', 'analyze', 'failures', 'simulate', 'traffic']
+DEFAULT_STAGES = ['parse', 'topology', 'validate', 'analyze', 'simulate']
+
+# Timings below this many seconds are too noisy to call a regression
+NOISE_FLOOR = 0.05
+
+def _simulate(graph, seconds):
+    engine = VirtualSimulationEngine(graph, seed=0)
+    engine.start()
+    engine.advance(seconds)
+    return engine
+
+def _traffic(graph, seconds, flows, rate):
+    """Drives random flows through the virtual engine. Returns link transmissions per wall-clock second."""
+    engine = VirtualSimulationEngine(graph, seed=0)
+    engine.start()
+    engine.start_random_flows(flows, rate)
+    started = time.perf_counter()
+    engine.advance(seconds)
+    return sum(link.packets for link in engine.links.values()) / (time.perf_counter() - started)
+
+def run_stages(config_dir, stages, workers=None, sim_seconds=10, trace_memory=True, traffic_load=(1, 100, 100)):
+    """Runs the pipeline on one config tree.
+
+    Returns ({stage: measurements}, max RSS in KiB or None where it can't be read). Parse and topology always
+    run because later stages need them, but are only reported if requested.
+    traffic_load is (virtual seconds, flows, packets per second per flow) for the
+    traffic stage, which also reports the simulator's packets per second.
+    """
+    results = {}
+
+    def measure(stage, func, required=False):
+        if stage not in stages and not required:
+            return None
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        # Keep the stages' own reports out of the benchmark output
+        with quiet_logging():
+            value = func()
+        seconds = time.perf_counter() - started
+        peak_kb = tracemalloc.get_traced_memory()[1] // 1024 if trace_memory else None
+        if trace_memory:
+            tracemalloc.stop()
+        if stage in stages:
+            results[stage] = {'seconds': seconds}
+            if peak_kb is not None:
+                results[stage]['peak_kb'] = peak_kb
+        return value
+
+    configs = measure('parse', lambda: parse_config_files(config_dir, workers=workers), required=True)
+    graph = measure('topology', lambda: create_topology(configs), required=True)
+    traffic = os.path.join(config_dir, 'traffic.csv')
+    demands = load_traffic_matrix(traffic) if os.path.exists(traffic) else None
+
+    measure('validate', lambda: run_validation_checks(graph))
+    measure('analyze', lambda: run_load_analysis(graph, demands))
+    measure('failures', lambda: run_failure_analysis(graph, demands, workers=workers))
+    measure('simulate', lambda: _simulate(graph, sim_seconds))
+    pps = measure('traffic', lambda: _traffic(graph, *traffic_load))
+    if pps is not None:
+        results['traffic']['pps'] = round(pps)
+    return results, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None
+
+def compare(results, baseline, tolerance):
+    """Returns a list of (scenario, stage, seconds, baseline seconds) that got slower than allowed."""
+    regressions = []
+    for scenario, stages in results.items():
+        for stage, measured in stages.items():
+            if stage == 'max_rss_kb':
+                continue
+            before = baseline.get(scenario, {}).get(stage)
+            if not before:
+                continue
+            if measured['seconds'] > NOISE_FLOOR and measured['seconds'] > before['seconds'] * (1 + tolerance):
+                regressions.append((scenario, stage, measured['seconds'], before['seconds']))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on synthetic networks")
+    parser.add_argument('--topology', choices=TOPOLOGIES, action='append', help="Repeatable; defaults to ring.")
+    parser.add_argument('--sizes', default='10,100,1000', help="Comma-separated device counts.")
+    parser.add_argument('--stages', default=','.join(DEFAULT_STAGES), help=f"Comma-separated subset of {','.join(STAGES)}.")
+    parser.add_argument('--duplicate-ips', type=int, default=5)
+    parser.add_argument('--mtu-mismatches', type=int, default=5)
+    parser.add_argument('--traffic-pairs', type=int, default=10000)
+    parser.add_argument('--sim-seconds', type=float, default=10, help="Virtual seconds to simulate after start-up.")
+    parser.add_argument('--traffic-flows', type=int, default=100, help="Random flows driven by the traffic stage.")
+    parser.add_argument('--traffic-rate', type=float, default=100, help="Packets per second of each traffic flow.")
+    parser.add_argument('--traffic-seconds', type=float, default=1, help="Virtual seconds the traffic stage runs.")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--no-memory', action='store_true', help="Skip tracemalloc; timings are then free of its overhead.")
+    parser.add_argument('--output', help="Write the results as JSON to this file.")
+    parser.add_argument('--baseline', help="Compare against a results JSON written earlier.")
+    parser.add_argument('--save-baseline', help="Write the results as the new baseline.")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown before a stage counts as regressed.")
+    args = parser.parse_args()
+
+    stages = args.stages.split(',')
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(unknown)}")
+
+    results = {}
+    for topology in args.topology or ['ring']:
+        for size in (int(s) for s in args.sizes.split(',')):
+            scenario = f"{topology}-{size}"
+            with tempfile.TemporaryDirectory() as config_dir:
+                generate(topology, size, config_dir, args.duplicate_ips, args.mtu_mismatches, args.traffic_pairs)
+                traffic_load = (args.traffic_seconds, args.traffic_flows, args.traffic_rate)
+                stage_results, rss_kb = run_stages(config_dir, stages, args.workers, args.sim_seconds, not args.no_memory,
+                                                   traffic_load)
+            results[scenario] = dict(stage_results, max_rss_kb=rss_kb)
+            for stage, measured in stage_results.items():
+                peak = f"  peak {measured['peak_kb']:>9} KiB" if 'peak_kb' in measured else ''
+                pps = f"  {measured['pps']:>9} pkt/s" if 'pps' in measured else ''
+                print(f"{scenario:<20}{stage:<10}{measured['seconds']:>10.3f}s{peak}{pps}")
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for scenario, stage, seconds, before in regressions:
+            print(f"[FAIL] {scenario} {stage}: {seconds:.3f}s vs baseline {before:.3f}s")
+        if regressions:
+            sys.exit(1)
+        print("[PASS] No stage regressed against the baseline.")
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,132 @@
 import argparse
+import contextlib
+import logging
+from src.instrument import (METRICS, LOG_LEVELS, LOG_FORMATS, METRIC_FORMATS, PROFILE_MODES, configure_logging,
+                            profile)
 from src.parser import parse_config_files
 from src.topology import create_topology, draw_topology
+from src.render import CLUSTER_MODES, RENDER_FORMATS, MAX_DETAIL_NODES, render_topology
 from src.validator import run_validation_checks
-from src.analyzer import run_load_analysis
+from src.cache import load_topology
+from src.analyzer import run_load_analysis, run_failure_analysis, load_traffic_matrix
 from src.simulator.engine import SimulationEngine # Import the engine
+from src.simulator.async_engine import AsyncSimulationEngine
+from src.simulator.virtual_engine import VirtualSimulationEngine
+from src.simulator.sharded_engine import ShardedSimulationEngine
+from src.simulator.snapshot import SnapshotError
+from src.watch import ConfigWatcher, DEFAULT_INTERVAL
+
+# Simulation engines selectable with --engine
+ENGINES = {
+    'threaded': SimulationEngine,
+    'async': AsyncSimulationEngine,
+    'virtual': VirtualSimulationEngine,
+    'sharded': ShardedSimulationEngine,
+}
+
+# Engines that run on a virtual clock and so can replay a script deterministically
+VIRTUAL_ENGINES = ('virtual', 'sharded')
+
+log = logging.getLogger('src.main')
 
 def main():
     parser = argparse.ArgumentParser(description="Network Analysis and Simulation Tool")
-    parser.add_argument('action', choices=['topology', 'validate', 'analyze', 'simulate'], help="Action to perform.")
+    parser.add_argument('action', choices=['topology', 'validate', 'analyze', 'failures', 'simulate', 'watch'], help="Action to perform.")
+    parser.add_argument('--workers', type=int, default=None, help="Number of processes used to parse config files and evaluate failure scenarios (default: one per CPU).")
+    parser.add_argument('--cache-dir', default=None, help="Directory for the incremental parse/topology cache. Only changed configs are reparsed on re-runs.")
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='threaded', help="Simulation engine: one thread per router, a single asyncio event loop, a deterministic virtual clock, or the virtual clock split across processes.")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed for the virtual engine and for sampling double failures.")
+    parser.add_argument('--script', default=None, help="File of simulation commands to run non-interactively (virtual and sharded engines only).")
+    parser.add_argument('--restore', default=None, help="Resume a simulation from a snapshot taken with 'save' instead of booting one from ./configs (virtual engine only).")
+    parser.add_argument('--record', default=None, help="Write the simulation's commands to this file when it ends, as a script --script replays (virtual and sharded engines only).")
+    parser.add_argument('--shards', type=int, default=None, help="Number of processes the sharded engine splits the network across (default: one per CPU).")
+    parser.add_argument('--traffic', default=None, help="Traffic matrix (CSV or JSON) of demands in kbps for the analyze, failures and watch actions, and to color links by utilization in SVG and HTML topologies.")
+    parser.add_argument('--double-failures', type=int, default=0, help="Number of random double link failures to evaluate in addition to every single link and node failure.")
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help="Seconds between scans of the config tree in watch mode.")
+    parser.add_argument('--format', choices=('png',) + RENDER_FORMATS, default='png', help="Topology output: a matplotlib PNG, a static SVG, or an interactive HTML page for large networks.")
+    parser.add_argument('--output', default=None, help="File the topology is saved to (default: topology.<format>).")
+    parser.add_argument('--cluster-by', choices=CLUSTER_MODES, default='community', help="How SVG and HTML output group devices, both for the layout and when collapsing large networks into clusters.")
+    parser.add_argument('--max-nodes', type=int, default=MAX_DETAIL_NODES, help="Devices shown individually before SVG output collapses clusters (HTML output switches as you zoom).")
+    parser.add_argument('--log-level', choices=LOG_LEVELS, default='info', help="Least severe messages to print; failed checks are warnings.")
+    parser.add_argument('--quiet', action='store_true', help="Print errors only, e.g. for batch runs that read --metrics instead.")
+    parser.add_argument('--log-format', choices=LOG_FORMATS, default='text', help="Print messages as plain text or as one JSON object per line.")
+    parser.add_argument('--profile', nargs='?', const='all', choices=PROFILE_MODES, default=None, help="Profile the action with cProfile (cpu), tracemalloc (memory) or both (the default) and print the report to stderr.")
+    parser.add_argument('--profile-out', default=None, help="Also save the raw cProfile statistics to this file, for pstats or snakeviz.")
+    parser.add_argument('--metrics', default=None, help="Write stage timings and counters to this file when the action finishes ('-' for stdout).")
+    parser.add_argument('--metrics-format', choices=METRIC_FORMATS, default='json', help="Format of the --metrics file.")
     args = parser.parse_args()
+    if args.script and args.engine not in VIRTUAL_ENGINES:
+        parser.error("--script requires --engine virtual or sharded")
+    if args.record and args.engine not in VIRTUAL_ENGINES:
+        parser.error("--record requires --engine virtual or sharded")
+    if args.restore and args.engine != 'virtual':
+        parser.error("--restore requires --engine virtual")
 
-    device_configs = parse_config_files('./configs')
-    network_graph = create_topology(device_configs)
+    configure_logging('error' if args.quiet else args.log_level, args.log_format)
+    with profile(args.profile, args.profile_out) if args.profile else contextlib.nullcontext():
+        run_action(args)
+    if args.metrics:
+        METRICS.write(args.metrics, args.metrics_format)
+
+def run_action(args):
+    if args.action == 'watch':
+        # Builds its own topology, and keeps it up to date as configs change
+        demands = load_traffic_matrix(args.traffic) if args.traffic else None
+        ConfigWatcher('./configs', demands, workers=args.workers).run(args.interval)
+        return
+    if args.action == 'simulate' and args.restore:
+        # The snapshot holds the topology as well, so no configs are parsed
+        try:
+            sim_engine = VirtualSimulationEngine.from_snapshot(args.restore)
+        except SnapshotError as e:
+            raise SystemExit(f"Error: {e}")
+        run_simulation(args, sim_engine)
+        return
+
+    if args.cache_dir:
+        _, network_graph = load_topology('./configs', args.cache_dir, workers=args.workers)
+    else:
+        # The graph keeps interfaces in its own table, so the parsed dicts can be dropped
+        network_graph = create_topology(parse_config_files('./configs', workers=args.workers))
 
     if args.action == 'topology':
-        print("Generating and saving network topology...")
-        draw_topology(network_graph)
+        log.info("Generating and saving network topology...")
+        if args.format == 'png':
+            draw_topology(network_graph, args.output or "topology.png")
+        else:
+            # Links are only colored by utilization when there is a traffic matrix to route
+            demands = load_traffic_matrix(args.traffic) if args.traffic else None
+            render_topology(network_graph, args.output or f"topology.{args.format}", args.format, demands,
+                            args.cluster_by, args.max_nodes, args.seed, args.cache_dir)
     elif args.action == 'validate':
         run_validation_checks(network_graph)
     elif args.action == 'analyze':
-        run_load_analysis(network_graph)
+        demands = load_traffic_matrix(args.traffic) if args.traffic else None
+        run_load_analysis(network_graph, demands)
+    elif args.action == 'failures':
+        demands = load_traffic_matrix(args.traffic) if args.traffic else None
+        run_failure_analysis(network_graph, demands, double_failures=args.double_failures, seed=args.seed, workers=args.workers)
     elif args.action == 'simulate':
         # This section launches the simulation
-        sim_engine = SimulationEngine(network_graph)
-        sim_engine.run()
+        if args.engine == 'virtual':
+            sim_engine = VirtualSimulationEngine(network_graph, seed=args.seed)
+        elif args.engine == 'sharded':
+            sim_engine = ShardedSimulationEngine(network_graph, shards=args.shards, seed=args.seed)
+        else:
+            sim_engine = ENGINES[args.engine](network_graph)
+        run_simulation(args, sim_engine)
+
+def run_simulation(args, sim_engine):
+    with METRICS.timer('simulate'):
+        try:
+            if args.script:
+                with open(args.script) as f:
+                    sim_engine.run_script(f)
+            else:
+                sim_engine.run()
+        finally:
+            if args.record:
+                sim_engine.write_command_log(args.record)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,56 +1,575 @@
-import networkx as nx
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import random
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .instrument import METRICS, timed
 
-def run_load_analysis(graph):
-    """Analyzes link capacity vs. a predefined traffic load."""
-    print("\n--- Running Load Analysis ---")
+log = logging.getLogger(__name__)
 
-    # Define a sample traffic demand in kilobits per second (kbps)
-    # R1's bandwidth is 100,000 kbps (100 Mbps), so this should pass.
-    traffic_demands = {
-        ('R1', 'R3'): 50000  # 50,000 kbps = 50 Mbps demand
+# Used when no traffic matrix is given, in kilobits per second (kbps).
+# R1's bandwidth is 100,000 kbps (100 Mbps), so this should pass.
+SAMPLE_DEMANDS = {
+    ('R1', 'R3'): 50000  # 50,000 kbps = 50 Mbps demand
+}
+
+# How many of the busiest links (or worst failure scenarios) the reports print
+REPORT_TOP_LINKS = 20
+
+# Below this many failure scenarios the cost of starting a process pool outweighs the gain
+MIN_SCENARIOS_FOR_POOL = 64
+
+# A shortest-path tree as parallel arrays in BFS order, excluding the root:
+# nodes[i] is reached from parents[i] over edge id edges[i]; levels[d] is the
+# offset of the first node at depth d + 1.
+PathTree = namedtuple('PathTree', ['root', 'nodes', 'parents', 'edges', 'levels'])
+
+# Node and edge numbering shared by every array in an analysis run; adjacency[u]
+# lists (neighbor id, edge id) pairs in the graph's own neighbor order
+EdgeIndex = namedtuple('EdgeIndex', ['nodes', 'node_ids', 'edges', 'edge_ids', 'capacity', 'adjacency'])
+
+def load_traffic_matrix(path):
+    """Loads a traffic matrix of demands in kbps from a CSV or JSON file.
+
+    CSV rows are source,target,demand (a header row is skipped). JSON is either
+    a list of {"source", "target", "demand"} objects or a nested
+    {source: {target: demand}} mapping. Returns (sources, targets, demands).
+    """
+    sources, targets, demands = [], [], []
+    if path.endswith('.json'):
+        with open(path, 'r') as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            rows = ((s, t, d) for s, row in data.items() for t, d in row.items())
+        else:
+            rows = ((item['source'], item['target'], item['demand']) for item in data)
+        for source, target, demand in rows:
+            sources.append(source)
+            targets.append(target)
+            demands.append(float(demand))
+    else:
+        with open(path, 'r', newline='') as f:
+            for row in csv.reader(f):
+                if len(row) < 3 or row[0].startswith('#'):
+                    continue
+                try:
+                    demand = float(row[2])
+                except ValueError:
+                    continue # Header row
+                sources.append(row[0].strip())
+                targets.append(row[1].strip())
+                demands.append(demand)
+    return sources, targets, np.array(demands, dtype=np.float64)
+
+def _demand_columns(demands):
+    """Accepts a {(source, target): demand} dict or (sources, targets, demands) columns."""
+    if isinstance(demands, dict):
+        pairs = list(demands.items())
+        return [s for (s, _), _ in pairs], [t for (_, t), _ in pairs], np.array([d for _, d in pairs], dtype=np.float64)
+    return demands
+
+def link_capacity(graph, u, v):
+    """Returns the total bandwidth of all links between two devices, in kbps."""
+    if graph.is_multigraph():
+        links = graph[u][v].values()
+    else:
+        links = graph[u][v].get('links', [graph[u][v]])
+    return sum(link.get('bandwidth') or 0 for link in links)
+
+def build_edge_index(graph):
+    """Numbers every node and every adjacent device pair, and collects edge capacities."""
+    nodes = list(graph.nodes())
+    node_ids = {node: i for i, node in enumerate(nodes)}
+    edges = []
+    edge_ids = {}
+    for u, v in graph.edges():
+        if (u, v) in edge_ids:
+            continue # A parallel link of a multigraph
+        edge_ids[(u, v)] = edge_ids[(v, u)] = len(edges)
+        edges.append((u, v))
+    capacity = np.array([link_capacity(graph, u, v) for u, v in edges], dtype=np.float64)
+    adjacency = [[(node_ids[v], edge_ids[(u, v)]) for v in graph.adj[u]] for u in nodes]
+    return EdgeIndex(nodes, node_ids, edges, edge_ids, capacity, adjacency)
+
+def shortest_path_tree(index, source, failed_edges=(), failed_nodes=()):
+    """Builds the hop-count shortest-path tree rooted at node id source.
+
+    Runs a breadth-first search over the integer adjacency, skipping any failed
+    edge or node ids, and visits neighbors in the same order networkx would.
+    """
+    adjacency = index.adjacency
+    seen = bytearray(len(index.nodes))
+    seen[source] = 1
+    for node in failed_nodes:
+        seen[node] = 1
+    nodes, parents, edges, levels = [], [], [], []
+    frontier = [source]
+    while frontier:
+        levels.append(len(nodes))
+        next_frontier = []
+        for u in frontier:
+            for v, e in adjacency[u]:
+                if not seen[v] and e not in failed_edges:
+                    seen[v] = 1
+                    nodes.append(v)
+                    parents.append(u)
+                    edges.append(e)
+                    next_frontier.append(v)
+        frontier = next_frontier
+    levels.pop() # The last frontier reached nothing new
+    # int32 keeps the trees small enough to cache one per source for failure analysis
+    return PathTree(source, np.array(nodes, dtype=np.int32), np.array(parents, dtype=np.int32),
+                    np.array(edges, dtype=np.int32), levels)
+
+def tree_link_loads(tree, demand_to):
+    """Routes one source's demands down its tree.
+
+    demand_to is indexed by node id. Returns (loads, stranded) where loads[i]
+    is the traffic crossing tree.edges[i] and stranded is the demand towards
+    nodes the tree does not reach.
+    """
+    # Each edge carries the demand of the whole subtree below it, so push the
+    # subtree totals up one BFS level at a time, deepest level first
+    subtree = demand_to.copy()
+    bounds = tree.levels + [len(tree.nodes)]
+    for depth in range(len(tree.levels) - 1, 0, -1):
+        level = slice(bounds[depth], bounds[depth + 1])
+        np.add.at(subtree, tree.parents[level], subtree[tree.nodes[level]])
+    loads = subtree[tree.nodes]
+    reached = demand_to[tree.root] + demand_to[tree.nodes].sum()
+    return loads, demand_to.sum() - reached
+
+def _group_by_source(index, sources, targets, demands):
+    """Groups demands by source node id.
+
+    Returns (groups, unknown) where groups is a list of (source id, target ids,
+    demands) and unknown is the demand naming devices not in the topology.
+    """
+    node_ids = index.node_ids
+    src = np.array([node_ids.get(s, -1) for s in sources], dtype=np.int64)
+    dst = np.array([node_ids.get(t, -1) for t in targets], dtype=np.int64)
+    known = (src >= 0) & (dst >= 0) & (src != dst)
+    unknown = float(demands[(src < 0) | (dst < 0)].sum())
+
+    src, dst, demands = src[known], dst[known], demands[known]
+    order = np.argsort(src, kind='stable')
+    src, dst, demands = src[order], dst[order], demands[order]
+    starts = np.flatnonzero(np.r_[True, src[1:] != src[:-1]]) if len(src) else np.array([], dtype=np.int64)
+    ends = np.r_[starts[1:], len(src)]
+    groups = [(int(src[a]), dst[a:b], demands[a:b]) for a, b in zip(starts, ends)]
+    return groups, unknown
+
+def _demand_vector(index, targets, demands):
+    """Turns one source's demands into a dense vector indexed by node id."""
+    return np.bincount(targets, weights=demands, minlength=len(index.nodes))
+
+def compute_link_loads(graph, demands, index=None):
+    """Routes a traffic matrix over hop-count shortest paths.
+
+    One shortest-path tree is built per source and all of that source's
+    demands are pushed down it at once. Returns (index, loads, stranded) where
+    loads is indexed by edge id and stranded is the demand that has no path.
+    """
+    if index is None:
+        index = build_edge_index(graph)
+    sources, targets, values = _demand_columns(demands)
+    groups, stranded = _group_by_source(index, sources, targets, values)
+
+    loads = np.zeros(len(index.edges), dtype=np.float64)
+    for source, group_targets, group_demands in groups:
+        tree = shortest_path_tree(index, source)
+        tree_loads, tree_stranded = tree_link_loads(tree, _demand_vector(index, group_targets, group_demands))
+        np.add.at(loads, tree.edges, tree_loads)
+        stranded += tree_stranded
+    METRICS.count('demands_routed', len(values))
+    METRICS.count('shortest_path_trees', len(groups))
+    return index, loads, stranded
+
+def utilization(index, loads):
+    """Returns load / capacity per edge; links with no known bandwidth but some load are infinite."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        util = loads / index.capacity
+    util[loads == 0] = 0.0
+    return util
+
+def secondary_path(index, loads, edge_id):
+    """Finds the fewest-hop path between an edge's two devices that avoids the edge itself.
+
+    Returns (device names from one end to the other, spare capacity in kbps of
+    its tightest link under the given loads), or None if the edge is the only
+    way between them.
+    """
+    u, v = index.edges[edge_id]
+    source, target = index.node_ids[u], index.node_ids[v]
+    tree = shortest_path_tree(index, source, failed_edges={edge_id})
+    reached_from = dict(zip(tree.nodes.tolist(), zip(tree.parents.tolist(), tree.edges.tolist())))
+    if target not in reached_from:
+        return None
+    path, edges = [target], []
+    while path[-1] != source:
+        parent, e = reached_from[path[-1]]
+        path.append(parent)
+        edges.append(e)
+    spare = min(float(index.capacity[e] - loads[e]) for e in edges)
+    return [index.nodes[n] for n in reversed(path)], spare
+
+@timed('analyze')
+def run_load_analysis(graph, demands=None):
+    """Analyzes link capacity vs. a traffic matrix and returns per-link results."""
+    log.info("\n--- Running Load Analysis ---")
+    if demands is None:
+        demands = SAMPLE_DEMANDS
+    sources, targets, values = _demand_columns(demands)
+    log.info("Routing %d demands totalling %.0f kbps...", len(values), values.sum())
+
+    index, loads, stranded = compute_link_loads(graph, (sources, targets, values))
+    util = utilization(index, loads)
+
+    results = []
+    for edge_id in np.argsort(-util, kind='stable'):
+        if loads[edge_id] == 0:
+            break
+        u, v = index.edges[edge_id]
+        results.append((u, v, float(loads[edge_id]), float(index.capacity[edge_id]), float(util[edge_id])))
+
+    secondary_paths = {}
+    for u, v, load, capacity, link_util in results[:REPORT_TOP_LINKS]:
+        log.log(logging.WARNING if link_util > 1 else logging.INFO,
+                "  - [%s] Link %s<->%s: %.0f kbps of %.0f kbps (%.1f%%)",
+                "FAIL" if link_util > 1 else "PASS", u, v, load, capacity, link_util * 100,
+                extra={'link': [u, v], 'load': load, 'capacity': capacity, 'utilization': link_util})
+        if link_util > 1:
+            secondary = secondary_paths[u, v] = secondary_path(index, loads, index.edge_ids[(u, v)])
+            if secondary is None:
+                log.info("      No secondary path between %s and %s avoids this link.", u, v)
+            else:
+                path, spare = secondary
+                log.info("      Secondary path: %s (%.0f kbps spare at its tightest link)", " -> ".join(path), spare,
+                         extra={'link': [u, v], 'secondary_path': path, 'spare': spare})
+    if len(results) > REPORT_TOP_LINKS:
+        log.info("  ... %d more loaded links not shown", len(results) - REPORT_TOP_LINKS)
+
+    overloaded = [r for r in results if r[4] > 1]
+    METRICS.gauge('overloaded_links', len(overloaded))
+    METRICS.gauge('stranded_kbps', stranded)
+    if stranded:
+        log.warning("[FAIL] %.0f kbps of demand has no path to its destination.", stranded)
+    if overloaded:
+        log.warning("Result: %d link(s) cannot support the traffic demand.", len(overloaded))
+    else:
+        log.info("Result: All links can handle the traffic demand.")
+
+    log.info("\n--- Analysis Complete ---\n")
+    return {'links': results, 'overloaded': overloaded, 'stranded': stranded, 'secondary_paths': secondary_paths}
+
+# One source's routed demand in a load model: its tree, each node id's hop count
+# from it (-1 if unreached), its demands, what they put on tree.edges, and what
+# they strand
+SourceRoute = namedtuple('SourceRoute', ['tree', 'depth', 'targets', 'demands', 'loads', 'stranded'])
+
+def _tree_depths(tree, size):
+    depth = np.full(size, -1, dtype=np.int32)
+    depth[tree.root] = 0
+    bounds = tree.levels + [len(tree.nodes)]
+    for d in range(len(tree.levels)):
+        depth[tree.nodes[bounds[d]:bounds[d + 1]]] = d + 1
+    return depth
+
+def _route_sources(state, sources, groups):
+    """Takes the given sources' old routes out of the model's loads and adds their new ones."""
+    index, routes, loads = state['index'], state['routes'], state['loads']
+    for source in sources:
+        old = routes.pop(source, None)
+        if old is not None:
+            np.subtract.at(loads, old.tree.edges, old.loads)
+        if source not in groups:
+            continue
+        group_targets, group_demands = groups[source]
+        tree = shortest_path_tree(index, source)
+        tree_loads, tree_stranded = tree_link_loads(tree, _demand_vector(index, group_targets, group_demands))
+        np.add.at(loads, tree.edges, tree_loads)
+        routes[source] = SourceRoute(tree, _tree_depths(tree, len(index.nodes)), group_targets, group_demands,
+                                     tree_loads, tree_stranded)
+    np.clip(loads, 0, None, out=loads) # Remove float noise from the subtractions
+
+def _stranded_total(state):
+    return state['unknown'] + sum(route.stranded for route in state['routes'].values())
+
+def prepare_load_model(graph, demands):
+    """Routes a traffic matrix like compute_link_loads, keeping what update_load_model needs.
+
+    The model is a dict holding the index, loads, stranded demand and one
+    SourceRoute per source. Its edge ids stay fixed for as long as it is
+    updated, so loads can be compared across updates by id.
+    """
+    index = build_edge_index(graph)
+    state = {
+        'index': index,
+        'demands': _demand_columns(demands),
+        'routes': {},
+        'loads': np.zeros(len(index.edges), dtype=np.float64),
+        'unknown': 0.0,
     }
+    groups, state['unknown'] = _group_by_source(index, *state['demands'])
+    groups = {source: (group_targets, group_demands) for source, group_targets, group_demands in groups}
+    _route_sources(state, sorted(groups), groups)
+    state['stranded'] = _stranded_total(state)
+    return state
+
+def update_load_model(state, graph, delta):
+    """Patches a load model for a TopologyDelta and returns the edge ids whose load or capacity changed.
 
-    for (source, target), demand in traffic_demands.items():
-        print(f"\nAnalyzing demand from {source} to {target} ({demand} kbps)...")
+    Removed devices and links keep their ids as holes with no capacity, and
+    new ones get fresh ids, so only the neighbor lists at the ends of links
+    that came or went are rebuilt. A source is rerouted only if its tree used
+    a removed link, a new link joins two of its depths that differ (a link
+    between equal depths never shortens a hop-count path), or its demands
+    changed because a device it sends from or to came or went.
+    """
+    index = state['index']
+    nodes, node_ids, edges, edge_ids, adjacency = index.nodes, index.node_ids, index.edges, index.edge_ids, index.adjacency
+    removed_edges = []
+    for u, v in delta.removed_links:
+        e = edge_ids.pop((u, v), None)
+        edge_ids.pop((v, u), None)
+        if e is not None:
+            removed_edges.append(e)
+    for name in delta.removed_devices:
+        n = node_ids.pop(name, None)
+        if n is not None:
+            adjacency[n] = []
+    for name in delta.added_devices:
+        node_ids[name] = len(nodes)
+        nodes.append(name)
+        adjacency.append([])
+    added_edges = []
+    for u, v in delta.added_links:
+        edge_ids[(u, v)] = edge_ids[(v, u)] = len(edges)
+        added_edges.append((node_ids[u], node_ids[v]))
+        edges.append((u, v))
+    for name in {name for pair in delta.added_links + delta.removed_links for name in pair if name in node_ids}:
+        adjacency[node_ids[name]] = [(node_ids[v], edge_ids[(name, v)]) for v in graph.adj[name]]
 
-        if not graph.has_node(source) or not graph.has_node(target):
-            print(f"[FAIL] Source {source} or Target {target} not in topology.")
+    old_loads, old_capacity = state['loads'], index.capacity
+    capacity = np.zeros(len(edges), dtype=np.float64)
+    capacity[:len(old_capacity)] = old_capacity
+    capacity[removed_edges] = 0.0
+    for u, v in delta.added_links + delta.modified_links:
+        capacity[edge_ids[(u, v)]] = link_capacity(graph, u, v)
+    index = state['index'] = index._replace(capacity=capacity)
+    loads = state['loads'] = np.zeros(len(edges), dtype=np.float64)
+    loads[:len(old_loads)] = old_loads
+
+    groups, state['unknown'] = _group_by_source(index, *state['demands'])
+    groups = {source: (group_targets, group_demands) for source, group_targets, group_demands in groups}
+    routes = state['routes']
+    affected = set()
+    for source in routes.keys() | groups.keys():
+        route = routes.get(source)
+        if route is None or source not in groups:
+            affected.add(source)
             continue
+        group_targets, group_demands = groups[source]
+        if not (np.array_equal(route.targets, group_targets) and np.array_equal(route.demands, group_demands)):
+            affected.add(source)
+        elif removed_edges and np.isin(route.tree.edges, removed_edges).any():
+            affected.add(source)
+        else:
+            depth, known = route.depth, len(route.depth)
+            for a, b in added_edges:
+                if (depth[a] if a < known else -1) != (depth[b] if b < known else -1):
+                    affected.add(source)
+                    break
+    _route_sources(state, sorted(affected), groups)
+    loads[removed_edges] = 0.0
+    state['stranded'] = _stranded_total(state)
 
-        try:
-            # Find the shortest path for the traffic
-            path = nx.shortest_path(graph, source=source, target=target)
-            print(f"  - Primary path found: {' -> '.join(path)}")
-
-            is_sufficient = True
-            # Check each link in the path
-            for i in range(len(path) - 1):
-                u, v = path[i], path[i+1]
-                
-                # To find the link's bandwidth, we need to find the connected interfaces
-                # This logic assumes the first found connected interface represents the link
-                link_bw = 0
-                for if_name, if_data in graph.nodes[u]['interfaces'].items():
-                    # This is a simplified check. A more robust solution would store
-                    # interface details on the graph edges themselves.
-                    if 'bandwidth' in if_data:
-                        link_bw = if_data['bandwidth']
-                        break
-                
-                if link_bw < demand:
-                    print(f"  - [FAIL] Link {u}->{v} cannot support demand. (Capacity: {link_bw} kbps, Demand: {demand} kbps)")
-                    is_sufficient = False
-                else:
-                    print(f"  - [PASS] Link {u}->{v} can support demand. (Capacity: {link_bw} kbps, Demand: {demand} kbps)")
-            
-            if is_sufficient:
-                print(f"Result: Primary path can handle the traffic demand.")
-            else:
-                # TODO: Recommend a secondary path if one exists
-                print(f"Result: Primary path is INSUFFICIENT for the traffic demand.")
+    size = len(old_loads)
+    changed = np.flatnonzero(~np.isclose(loads[:size], old_loads) | (capacity[:size] != old_capacity))
+    return changed.tolist() + list(range(size, len(edges)))
+
+def _inverted_index(arrays):
+    """Maps each value found in a list of arrays to the positions of the arrays containing it."""
+    if not arrays:
+        return {}
+    keys = np.concatenate([np.unique(a) for a in arrays])
+    owners = np.repeat(np.arange(len(arrays)), [len(np.unique(a)) for a in arrays])
+    order = np.argsort(keys, kind='stable')
+    keys, owners = keys[order], owners[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else []
+    ends = np.r_[starts[1:], len(keys)]
+    return {int(keys[a]): owners[a:b] for a, b in zip(starts, ends)}
+
+def prepare_failure_analysis(graph, demands):
+    """Computes the no-failure baseline that every failure scenario is patched from.
+
+    Besides the baseline loads this keeps one shortest-path tree per source,
+    with its demand vector and what it loads each tree edge with, and indexes
+    which sources route over each edge, transit each node, or send to each
+    node, so a scenario only recomputes the trees its failure touches and
+    only pays for their new searches.
+    """
+    index = build_edge_index(graph)
+    sources, targets, values = _demand_columns(demands)
+    groups, stranded = _group_by_source(index, sources, targets, values)
+
+    trees, demand_vectors, baseline = [], [], []
+    loads = np.zeros(len(index.edges), dtype=np.float64)
+    for source, group_targets, group_demands in groups:
+        tree = shortest_path_tree(index, source)
+        demand_to = _demand_vector(index, group_targets, group_demands)
+        tree_loads, tree_stranded = tree_link_loads(tree, demand_to)
+        np.add.at(loads, tree.edges, tree_loads)
+        stranded += tree_stranded
+        trees.append(tree)
+        demand_vectors.append(demand_to)
+        baseline.append((tree_loads, tree_stranded))
+
+    return {
+        'index': index,
+        'groups': groups,
+        'trees': trees,
+        'demand_vectors': demand_vectors,
+        'tree_loads': baseline,
+        'loads': loads,
+        'stranded': stranded,
+        'edge_users': _inverted_index([tree.edges for tree in trees]),
+        'transit_users': _inverted_index([tree.parents for tree in trees]),
+        'dest_users': _inverted_index([group_targets for _, group_targets, _ in groups]),
+        'source_group': {source: g for g, (source, _, _) in enumerate(groups)},
+    }
+
+def failure_scenarios(index, node_failures=True, double_failures=0, seed=0):
+    """Lists (label, failed edge ids, failed node ids) for every N-1 and sampled N-2 failure.
+
+    A link failure takes down every link between the two devices.
+    """
+    scenarios = [(f"link {u}-{v}", [e], []) for e, (u, v) in enumerate(index.edges)]
+    if node_failures:
+        scenarios += [(f"node {node}", [], [n]) for n, node in enumerate(index.nodes)]
+    if double_failures:
+        rng = random.Random(seed)
+        n_edges = len(index.edges)
+        wanted = min(double_failures, n_edges * (n_edges - 1) // 2)
+        pairs = set()
+        while len(pairs) < wanted:
+            pairs.add(tuple(sorted(rng.sample(range(n_edges), 2))))
+        for a, b in sorted(pairs):
+            (u1, v1), (u2, v2) = index.edges[a], index.edges[b]
+            scenarios.append((f"links {u1}-{v1} + {u2}-{v2}", [a, b], []))
+    return scenarios
+
+NO_USERS = np.array([], dtype=np.int64)
+
+# Read-only baseline shared with failure-analysis workers, set once per process
+_failure_state = None
+
+def _init_failure_worker(state):
+    global _failure_state
+    _failure_state = state
+
+def _evaluate_scenario(scenario):
+    """Patches the baseline loads for one failure scenario.
+
+    Returns (label, stranded demand, worst utilization, worst link).
+    """
+    label, failed_edges, failed_nodes = scenario
+    state = _failure_state
+    index, groups, trees = state['index'], state['groups'], state['trees']
+    loads = state['loads'].copy()
+    stranded = state['stranded']
+
+    # Only sources whose tree crosses a failed element need new paths
+    rerouted = set()
+    for e in failed_edges:
+        rerouted.update(state['edge_users'].get(e, NO_USERS).tolist())
+    for n in failed_nodes:
+        rerouted.update(state['transit_users'].get(n, NO_USERS).tolist())
+        if n in state['source_group']:
+            rerouted.add(state['source_group'][n])
+
+    failed_edge_set = set(failed_edges)
+    for g in sorted(rerouted):
+        source = groups[g][0]
+        demand_to = state['demand_vectors'][g]
+        old_loads, old_stranded = state['tree_loads'][g]
+        np.subtract.at(loads, trees[g].edges, old_loads)
+        stranded -= old_stranded
+        if source in failed_nodes:
+            stranded += demand_to.sum()
+            continue
+        if failed_nodes:
+            stranded += demand_to[failed_nodes].sum()
+            demand_to = demand_to.copy() # The baseline's vector is shared by every scenario
+            demand_to[failed_nodes] = 0
+        new_tree = shortest_path_tree(index, source, failed_edge_set, failed_nodes)
+        new_loads, new_stranded = tree_link_loads(new_tree, demand_to)
+        np.add.at(loads, new_tree.edges, new_loads)
+        stranded += new_stranded
+
+    # A failed node that is only a leaf of a tree leaves the tree intact; its own demand is just lost
+    for n in failed_nodes:
+        for g in state['dest_users'].get(n, NO_USERS).tolist():
+            if g in rerouted:
+                continue
+            _, group_targets, group_demands = groups[g]
+            lost = np.zeros(len(index.nodes))
+            lost[n] = group_demands[group_targets == n].sum()
+            lost_loads, already_stranded = tree_link_loads(trees[g], lost)
+            np.subtract.at(loads, trees[g].edges, lost_loads)
+            stranded += lost[n] - already_stranded
+
+    np.clip(loads, 0, None, out=loads) # Remove float noise from the subtractions
+    util = utilization(index, loads)
+    if not len(util) or util.max() == 0:
+        return label, stranded, 0.0, None
+    worst = int(np.argmax(util))
+    return label, stranded, float(util[worst]), index.edges[worst]
+
+@timed('failures')
+def run_failure_analysis(graph, demands=None, node_failures=True, double_failures=0, seed=0, workers=None):
+    """Evaluates every single link and node failure (plus sampled double link failures)
+    against a traffic matrix and reports stranded demand and worst link utilization."""
+    log.info("\n--- Running Failure Analysis ---")
+    if demands is None:
+        demands = SAMPLE_DEMANDS
+    state = prepare_failure_analysis(graph, demands)
+    scenarios = failure_scenarios(state['index'], node_failures, double_failures, seed)
+    METRICS.count('failure_scenarios', len(scenarios))
+    base_util = utilization(state['index'], state['loads'])
+    log.info("Baseline: worst link utilization %.1f%%, %.0f kbps stranded. Evaluating %d failure scenarios...",
+             (base_util.max() if len(base_util) else 0) * 100, state['stranded'], len(scenarios))
 
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(scenarios) < MIN_SCENARIOS_FOR_POOL:
+        _init_failure_worker(state)
+        results = [_evaluate_scenario(scenario) for scenario in scenarios]
+    else:
+        # Forked workers inherit the baseline instead of unpickling it
+        context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        chunksize = max(1, len(scenarios) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_failure_worker, initargs=(state,)) as pool:
+            results = list(pool.map(_evaluate_scenario, scenarios, chunksize=chunksize))
 
-        except nx.NetworkXNoPath:
-            print(f"[FAIL] No path exists between {source} and {target}.")
+    results.sort(key=lambda r: (-r[1], -r[2]))
+    for label, stranded, worst_util, worst_link in results[:REPORT_TOP_LINKS]:
+        failed = stranded > 0 or worst_util > 1
+        link = f"{worst_link[0]}<->{worst_link[1]} at {worst_util:.1%}" if worst_link else "none loaded"
+        log.log(logging.WARNING if failed else logging.INFO, "  - [%s] %s: %.0f kbps stranded, worst link %s",
+                "FAIL" if failed else "PASS", label, stranded, link,
+                extra={'scenario': label, 'stranded': stranded, 'worst_utilization': worst_util,
+                       'worst_link': list(worst_link) if worst_link else None})
+    if len(results) > REPORT_TOP_LINKS:
+        log.info("  ... %d more scenarios not shown", len(results) - REPORT_TOP_LINKS)
 
-    print("\n--- Analysis Complete ---\n")
\ No newline at end of file
+    failing = [r for r in results if r[1] > 0 or r[2] > 1]
+    METRICS.gauge('failing_scenarios', len(failing))
+    log.info("Result: %d of %d failure scenarios strand demand or overload a link.", len(failing), len(results))
+    log.info("\n--- Failure Analysis Complete ---\n")
+    return results
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import pickle
+from .instrument import METRICS, timed
+from .parser import find_config_files, parse_config_paths
+from .topology import create_topology, update_topology
+
+# Bump whenever the parsed data or graph layout changes so stale caches are rebuilt
+CACHE_VERSION = 3
+INDEX_FILE = 'parse_index.json'
+TOPOLOGY_FILE = 'topology.pickle'
+
+def file_digest(path):
+    """Returns the SHA-1 hex digest of a file's contents."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _load_index(cache_dir, multigraph):
+    """Reads the parse index, discarding it if it was written by another version or graph type."""
+    try:
+        with open(os.path.join(cache_dir, INDEX_FILE), 'r') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get('version') != CACHE_VERSION or index.get('multigraph') != multigraph:
+        return None
+    return index
+
+def _load_graph(cache_dir):
+    """Reads the cached topology graph, if there is a usable one."""
+    try:
+        with open(os.path.join(cache_dir, TOPOLOGY_FILE), 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+def write_atomic(path, mode, write):
+    """Writes a file via a temporary sibling so an interrupted run never leaves it half-written."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, mode) as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+def scan_config_files(directory, entries):
+    """Compares the config tree against cached entries.
+
+    Returns (entries, reparse) where entries maps every current path to its cache
+    entry (reused ones untouched) and reparse lists the paths that need parsing.
+    Files whose size and mtime are unchanged are trusted; otherwise the content
+    hash decides whether the file really changed.
+    """
+    current = {}
+    reparse = []
+    for path in find_config_files(directory):
+        stat = os.stat(path)
+        entry = entries.get(path)
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            current[path] = entry
+            continue
+        sha1 = file_digest(path)
+        if entry and entry['sha1'] == sha1:
+            # Touched but not modified, e.g. re-copied by the backup job
+            current[path] = dict(entry, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            continue
+        current[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': sha1, 'data': None}
+        reparse.append(path)
+    return current, reparse
+
+def configs_from_entries(entries):
+    """Rebuilds the hostname -> parsed data mapping from cache entries."""
+    configs = {}
+    for entry in entries.values():
+        data = entry['data']
+        if data and 'hostname' in data:
+            configs[data['hostname']] = data
+    return configs
+
+def diff_configs(old_configs, new_configs):
+    """Returns (changed, removed) hostnames between two parsed config mappings."""
+    changed = [name for name, data in new_configs.items() if old_configs.get(name) != data]
+    removed = [name for name in old_configs if name not in new_configs]
+    return changed, removed
+
+@timed('load_topology')
+def load_topology(directory, cache_dir, workers=None, multigraph=False):
+    """Parses a config tree and builds its topology, reusing the on-disk cache where possible.
+
+    Only new or modified config files are reparsed, and the cached graph is
+    patched for the devices whose parsed data changed. Returns (configs, graph).
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    index = _load_index(cache_dir, multigraph)
+    old_entries = index['files'] if index else {}
+
+    entries, reparse = scan_config_files(directory, old_entries)
+    for path, data in parse_config_paths(reparse, workers):
+        entries[path]['data'] = data
+
+    old_configs = configs_from_entries(old_entries)
+    configs = configs_from_entries(entries)
+    changed, removed = diff_configs(old_configs, configs)
+    METRICS.count('cache_files_reused', len(entries) - len(reparse))
+
+    graph = _load_graph(cache_dir) if index else None
+    graph_dirty = True
+    if graph is None:
+        graph = create_topology(configs, multigraph=multigraph)
+    elif changed or removed:
+        update_topology(graph, configs, changed, removed)
+    else:
+        graph_dirty = False
+
+    if graph_dirty:
+        write_atomic(os.path.join(cache_dir, TOPOLOGY_FILE), 'wb', lambda f: pickle.dump(graph, f, pickle.HIGHEST_PROTOCOL))
+    if index is None or entries != old_entries:
+        index = {'version': CACHE_VERSION, 'multigraph': multigraph, 'files': entries}
+        write_atomic(os.path.join(cache_dir, INDEX_FILE), 'w', lambda f: json.dump(index, f))
+    return configs, graph
@@ -0,0 +1,206 @@
+from array import array
+import numpy as np
+
+NO_ADDRESS = 255  # prefixlen of an interface without an IP address
+DEAD = 0xFFFFFFFF # device id of a row whose device was removed
+
+_prefixlen_cache = {}
+
+def ip_to_int(ip):
+    """Converts a dotted-quad string to a 32-bit integer, raising ValueError if it is malformed."""
+    parts = ip.split('.')
+    if len(parts) != 4:
+        raise ValueError(f"Invalid IPv4 address: {ip}")
+    value = 0
+    for part in parts:
+        octet = int(part)
+        if not 0 <= octet <= 255:
+            raise ValueError(f"Invalid IPv4 address: {ip}")
+        value = (value << 8) | octet
+    return value
+
+def int_to_ip(value):
+    return f"{value >> 24}.{(value >> 16) & 255}.{(value >> 8) & 255}.{value & 255}"
+
+def prefix_mask(prefixlen):
+    return (0xFFFFFFFF << (32 - prefixlen)) & 0xFFFFFFFF
+
+def mask_to_prefixlen(mask):
+    """Converts a dotted-quad netmask to a prefix length, raising ValueError if it is not contiguous."""
+    prefixlen = _prefixlen_cache.get(mask)
+    if prefixlen is None:
+        value = ip_to_int(mask)
+        prefixlen = bin(value).count('1')
+        if value != prefix_mask(prefixlen):
+            raise ValueError(f"Invalid netmask: {mask}")
+        _prefixlen_cache[mask] = prefixlen
+    return prefixlen
+
+class InterfaceTable:
+    """Every interface in the network as parallel typed columns, one row per interface.
+
+    Addresses are stored as integers with a prefix length so subnet math is
+    plain integer arithmetic, and interface names are interned. Rows of a
+    device are contiguous; removing a device marks its rows dead until the
+    next compact().
+    """
+    def __init__(self):
+        self.devices = []    # device id -> hostname
+        self.device_ids = {} # hostname -> device id, live devices only
+        self.spans = {}      # device id -> (first row, last row + 1)
+        self.names = []      # name id -> interface name
+        self.name_ids = {}
+        self.device = array('I')
+        self.name = array('I')
+        self.ip = array('I')
+        self.prefixlen = array('B')
+        self.bandwidth = array('Q') # kbps, 0 if not configured
+        self.mtu = array('I')       # 0 if not configured
+        self.dead_rows = 0
+
+    @classmethod
+    def from_configs(cls, configs):
+        table = cls()
+        for device_name, data in configs.items():
+            table.add_device(device_name, data.get('interfaces', {}))
+        return table
+
+    def __len__(self):
+        return len(self.device) - self.dead_rows
+
+    def _intern(self, name):
+        name_id = self.name_ids.get(name)
+        if name_id is None:
+            name_id = self.name_ids[name] = len(self.names)
+            self.names.append(name)
+        return name_id
+
+    def add_device(self, device_name, interfaces):
+        """Appends a device's parsed interfaces, replacing any rows it already had."""
+        if device_name in self.device_ids:
+            self.remove_device(device_name)
+        device_id = self.device_ids[device_name] = len(self.devices)
+        self.devices.append(device_name)
+        first = len(self.device)
+        for if_name, if_data in interfaces.items():
+            ip, prefixlen = 0, NO_ADDRESS
+            if 'ip' in if_data:
+                try:
+                    ip, prefixlen = ip_to_int(if_data['ip']), mask_to_prefixlen(if_data['mask'])
+                except (ValueError, KeyError):
+                    # Handles cases where IP/mask might be invalid
+                    ip, prefixlen = 0, NO_ADDRESS
+            self.device.append(device_id)
+            self.name.append(self._intern(if_name))
+            self.ip.append(ip)
+            self.prefixlen.append(prefixlen)
+            self.bandwidth.append(if_data.get('bandwidth', 0))
+            self.mtu.append(if_data.get('mtu', 0))
+        self.spans[device_id] = (first, len(self.device))
+        return device_id
+
+    def remove_device(self, device_name):
+        device_id = self.device_ids.pop(device_name, None)
+        if device_id is None:
+            return
+        first, last = self.spans.pop(device_id)
+        for row in range(first, last):
+            self.device[row] = DEAD
+        self.dead_rows += last - first
+        if self.dead_rows > len(self.device) // 2:
+            self.compact()
+
+    def compact(self):
+        """Drops the rows of removed devices and renumbers device ids in insertion order."""
+        live = sorted(self.device_ids.items(), key=lambda item: item[1])
+        old_spans = self.spans
+        old_columns = (self.name, self.ip, self.prefixlen, self.bandwidth, self.mtu)
+        self.devices, self.device_ids, self.spans = [], {}, {}
+        self.device = array('I')
+        new_columns = tuple(array(column.typecode) for column in old_columns)
+        for device_name, old_id in live:
+            first, last = old_spans[old_id]
+            device_id = self.device_ids[device_name] = len(self.devices)
+            self.devices.append(device_name)
+            start = len(self.device)
+            self.device.extend([device_id] * (last - first))
+            for new_column, old_column in zip(new_columns, old_columns):
+                new_column.extend(old_column[first:last])
+            self.spans[device_id] = (start, len(self.device))
+        self.name, self.ip, self.prefixlen, self.bandwidth, self.mtu = new_columns
+        self.dead_rows = 0
+
+    def rows_of(self, device_name):
+        """Returns the range of row numbers holding a device's interfaces."""
+        device_id = self.device_ids.get(device_name)
+        if device_id is None:
+            return range(0)
+        return range(*self.spans[device_id])
+
+    def find(self, device_name, if_name):
+        """Returns the row of a device's interface, or None."""
+        name_id = self.name_ids.get(if_name)
+        for row in self.rows_of(device_name):
+            if self.name[row] == name_id:
+                return row
+        return None
+
+    def device_name(self, row):
+        return self.devices[self.device[row]]
+
+    def interface_name(self, row):
+        return self.names[self.name[row]]
+
+    def is_addressed(self, row):
+        return self.prefixlen[row] != NO_ADDRESS
+
+    def network(self, row):
+        """Returns (network address, prefix length) of an addressed row."""
+        prefixlen = self.prefixlen[row]
+        return self.ip[row] & prefix_mask(prefixlen), prefixlen
+
+    def interfaces_of(self, device_name):
+        """Returns a device's interfaces in the parser's {name: {'ip', 'mask', ...}} format."""
+        interfaces = {}
+        for row in self.rows_of(device_name):
+            data = {}
+            if self.is_addressed(row):
+                data['ip'] = int_to_ip(self.ip[row])
+                data['mask'] = int_to_ip(prefix_mask(self.prefixlen[row]))
+            if self.bandwidth[row]:
+                data['bandwidth'] = self.bandwidth[row]
+            if self.mtu[row]:
+                data['mtu'] = self.mtu[row]
+            interfaces[self.interface_name(row)] = data
+        return interfaces
+
+    def columns(self):
+        """Returns zero-copy NumPy views of the device, ip and prefixlen columns."""
+        return (np.frombuffer(self.device, dtype=np.uint32), np.frombuffer(self.ip, dtype=np.uint32),
+                np.frombuffer(self.prefixlen, dtype=np.uint8))
+
+    def addressed_rows(self):
+        """Returns the row numbers of live interfaces that have an IP address."""
+        device, _, prefixlen = self.columns()
+        return np.flatnonzero((device != DEAD) & (prefixlen != NO_ADDRESS))
+
+    def subnet_index(self):
+        """Groups addressed rows by network in one vectorized pass.
+
+        Returns {(network address, prefix length): [rows]}, in row order within
+        each group and in order of first appearance across groups.
+        """
+        rows = self.addressed_rows()
+        if not len(rows):
+            return {}
+        _, ip, prefixlen = self.columns()
+        plen = prefixlen[rows].astype(np.uint64)
+        masks = (np.uint64(0xFFFFFFFF) << (np.uint64(32) - plen)) & np.uint64(0xFFFFFFFF)
+        keys = ((ip[rows].astype(np.uint64) & masks) << np.uint64(6)) | plen
+
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+        groups = sorted(((int(order[a]), rows[order[a:b]].tolist(), int(sorted_keys[a])) for a, b in zip(starts, ends)))
+        return {(key >> 6, key & 63): members for _, members, key in groups}
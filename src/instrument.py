@@ -0,0 +1,204 @@
+import cProfile
+import contextlib
+import functools
+import json
+import logging
+import pstats
+import sys
+import time
+import tracemalloc
+
+# Every module logs under this package's logger, so one call configures them all
+LOGGER_NAME = __name__.rpartition('.')[0]
+LOG_LEVELS = ('debug', 'info', 'warning', 'error')
+LOG_FORMATS = ('text', 'json')
+
+METRIC_PREFIX = 'nettool'
+METRIC_FORMATS = ('json', 'prometheus')
+
+PROFILE_MODES = ('cpu', 'memory', 'all')
+PROFILE_TOP = 25 # Functions shown in the cProfile report
+MEMORY_TOP = 10  # Allocation sites shown in the tracemalloc report
+
+class Metrics:
+    """Named counters, gauges and stage timers for one run.
+
+    Stages add their totals once per call rather than per item, and the
+    simulator hands over its own counters when it stops, so nothing here
+    sits on a per-packet path.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counters = {}
+        self.gauges = {}
+        self.timers = {} # name -> [calls, total seconds, longest call in seconds]
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        self.gauges[name] = value
+
+    def peak(self, name, value):
+        """Sets a gauge to value if it is higher than what the gauge holds."""
+        if name not in self.gauges or value > self.gauges[name]:
+            self.gauges[name] = value
+
+    def add_time(self, name, seconds):
+        timer = self.timers.setdefault(name, [0, 0.0, 0.0])
+        timer[0] += 1
+        timer[1] += seconds
+        timer[2] = max(timer[2], seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def timed(self, name):
+        """Decorates a function so every call is added to the named timer."""
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def snapshot(self):
+        return {
+            'counters': dict(sorted(self.counters.items())),
+            'gauges': dict(sorted(self.gauges.items())),
+            'timers': {name: {'calls': calls, 'seconds': total, 'max_seconds': longest}
+                       for name, (calls, total, longest) in sorted(self.timers.items())},
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """Renders the metrics in the Prometheus text exposition format."""
+        lines = []
+        for name, value in sorted(self.counters.items()):
+            metric = f"{METRIC_PREFIX}_{name}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for name, value in sorted(self.gauges.items()):
+            metric = f"{METRIC_PREFIX}_{name}"
+            lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+        # Timers are one family per statistic, labelled by stage
+        for suffix, kind, column in (('stage_calls_total', 'counter', 0), ('stage_seconds_total', 'counter', 1),
+                                     ('stage_max_seconds', 'gauge', 2)):
+            if not self.timers:
+                break
+            metric = f"{METRIC_PREFIX}_{suffix}"
+            lines.append(f"# TYPE {metric} {kind}")
+            lines += [f'{metric}{{stage="{name}"}} {timer[column]}' for name, timer in sorted(self.timers.items())]
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path, fmt='json'):
+        """Writes the metrics to a file, or to stdout if path is '-'."""
+        text = self.to_prometheus() if fmt == 'prometheus' else self.to_json() + '\n'
+        if path == '-':
+            sys.stdout.write(text)
+        else:
+            with open(path, 'w') as f:
+                f.write(text)
+
+# The process-wide registry every stage reports to
+METRICS = Metrics()
+
+def timed(name):
+    """Decorates a function so every call is added to METRICS' named timer."""
+    return METRICS.timed(name)
+
+@contextlib.contextmanager
+def profile(mode='all', out=None, report=None):
+    """Runs the body under cProfile, tracemalloc or both, and writes their reports.
+
+    The cProfile report lists the top functions by cumulative time and is also
+    dumped to out for pstats or snakeviz if given; the tracemalloc report lists
+    the largest allocation sites and sets the memory_peak_bytes gauge. Reports
+    go to stderr by default so they don't mix with a stage's own output. Only
+    this thread is profiled, not router threads or worker processes.
+    """
+    report = report or sys.stderr
+    profiler = cProfile.Profile() if mode in ('cpu', 'all') else None
+    tracing = mode in ('memory', 'all') and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+        if tracing:
+            # Snapshot before any reporting, leaving out the profilers' own allocations
+            snapshot = tracemalloc.take_snapshot().filter_traces(
+                [tracemalloc.Filter(False, module.__file__) for module in (tracemalloc, cProfile)])
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        if profiler:
+            if out:
+                profiler.dump_stats(out)
+            pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(PROFILE_TOP)
+        if tracing:
+            METRICS.gauge('memory_peak_bytes', peak)
+            print(f"Peak traced memory: {peak // 1024} KiB. Largest allocation sites:", file=report)
+            for stat in snapshot.statistics('lineno')[:MEMORY_TOP]:
+                print(f"  {stat}", file=report)
+
+class _ConsoleHandler(logging.StreamHandler):
+    """Writes to whatever sys.stdout is at the time, so redirect_stdout still captures log output."""
+    def __init__(self):
+        super().__init__(sys.stdout)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+# Attributes every LogRecord has; anything else on a record came from extra= and is a structured field
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as one JSON object, including the fields passed with extra=."""
+    def format(self, record):
+        event = {'time': round(record.created, 3), 'level': record.levelname.lower(), 'logger': record.name,
+                 'message': record.getMessage().strip()}
+        event.update((key, value) for key, value in vars(record).items() if key not in _RECORD_FIELDS)
+        if record.exc_info:
+            event['exception'] = self.formatException(record.exc_info)
+        return json.dumps(event, default=str)
+
+def configure_logging(level='info', fmt='text'):
+    """Sends the tool's log records to stdout, as bare messages or as one JSON object per line."""
+    handler = _ConsoleHandler()
+    handler.setFormatter(JsonFormatter() if fmt == 'json' else logging.Formatter('%(message)s'))
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.handlers[:] = [handler]
+    logger.setLevel(level.upper())
+    logger.propagate = False
+
+@contextlib.contextmanager
+def quiet_logging(level=logging.ERROR):
+    """Raises the tool's log level for the body, so stage progress reports are dropped rather than printed."""
+    logger = logging.getLogger(LOGGER_NAME)
+    previous = logger.level
+    logger.setLevel(max(level, logger.getEffectiveLevel()))
+    try:
+        yield
+    finally:
+        logger.setLevel(previous)
+
+# Used as a library, the tool stays silent unless the caller configures logging
+logging.getLogger(LOGGER_NAME).addHandler(logging.NullHandler())
@@ -1,56 +1,113 @@
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor
+from .instrument import METRICS, timed
 
-def parse_config_files(directory):
+# Precompiled patterns, matched against a single line after its leading keyword
+HOSTNAME_RE = re.compile(r"hostname\s+(\S+)")
+INTERFACE_RE = re.compile(r"interface\s+(\S+)")
+IP_ADDRESS_RE = re.compile(r"ip address\s+([\d\.]+)\s+([\d\.]+)")
+BANDWIDTH_RE = re.compile(r"bandwidth\s+(\d+)")
+MTU_RE = re.compile(r"mtu\s+(\d+)")
+STATIC_ROUTE_RE = re.compile(r"ip route\s+([\d\.]+)\s+([\d\.]+)\s+(\S+)")
+
+# Below this many files the cost of starting a process pool outweighs the gain
+MIN_FILES_FOR_POOL = 8
+
+def find_config_files(directory):
+    """Returns the path of every <device>/config.dump under a directory."""
+    paths = []
+    for entry in os.scandir(directory):
+        config_path = os.path.join(entry.path, 'config.dump')
+        if entry.is_dir() and os.path.exists(config_path):
+            paths.append(config_path)
+    return paths
+
+def parse_config_files(directory, workers=None):
     """Parses all config.dump files in a directory and returns a dictionary."""
     configs = {}
-    for device_name in os.listdir(directory):
-        config_path = os.path.join(directory, device_name, 'config.dump')
-        if os.path.isdir(os.path.join(directory, device_name)) and os.path.exists(config_path):
-            with open(config_path, 'r') as f:
-                content = f.read()
-                # The hostname from the file is the most reliable source
-                hostname_match = re.search(r"hostname\s+(\S+)", content)
-                if hostname_match:
-                    hostname = hostname_match.group(1)
-                    configs[hostname] = parse_single_config(content)
+    for _, data in parse_config_paths(find_config_files(directory), workers):
+        # The hostname from the file is the most reliable source
+        if 'hostname' in data:
+            configs[data['hostname']] = data
     return configs
 
+# Timed here rather than on parse_config_files so the cache and watch paths, which call this directly, are covered too
+@timed('parse')
+def parse_config_paths(paths, workers=None):
+    """Parses the given config files, fanning them out across a process pool.
+
+    Returns a list of (path, data) tuples in the order the paths were given.
+    workers defaults to the number of CPUs; 1 parses in this process.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    METRICS.count('files_parsed', len(paths))
+    if workers <= 1 or len(paths) < MIN_FILES_FOR_POOL:
+        return [(path, parse_config_file(path)) for path in paths]
+
+    # Hand each worker a reasonable batch of files to keep IPC overhead low
+    chunksize = max(1, len(paths) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(zip(paths, pool.map(parse_config_file, paths, chunksize=chunksize)))
+
+def parse_config_file(path):
+    """Streams a single config file line by line and returns its parsed data."""
+    with open(path, 'r') as f:
+        return parse_config_lines(f)
+
 def parse_single_config(content):
-    """Uses regex to extract info from a single config file's content."""
+    """Extracts info from a single config file's content."""
+    return parse_config_lines(content.splitlines())
+
+def parse_config_lines(lines):
+    """Parses config lines in a single pass, dispatching on each line's leading keyword."""
     data = {'interfaces': {}}
-    
-    # Extract hostname
-    hostname_match = re.search(r"hostname\s+(\S+)", content)
-    if hostname_match:
-        data['hostname'] = hostname_match.group(1)
-    
-    # Extract default gateway (static default route)
-    gateway_match = re.search(r"ip route 0\.0\.0\.0 0\.0\.0\.0 (\S+)", content)
-    if gateway_match:
-        data['default_gateway'] = gateway_match.group(1)
-
-    # Find all interface configuration blocks
-    interface_blocks = re.findall(r"interface\s+(\S+)\n(.+?)(?=\n!|\Z)", content, re.DOTALL)
-    
-    for if_name, if_config in interface_blocks:
-        data['interfaces'][if_name] = {}
-        
-        # Extract IP address and subnet mask
-        ip_match = re.search(r"ip address\s+([\d\.]+)\s+([\d\.]+)", if_config)
-        if ip_match:
-            data['interfaces'][if_name]['ip'] = ip_match.group(1)
-            data['interfaces'][if_name]['mask'] = ip_match.group(2)
-
-        # Extract bandwidth
-        bw_match = re.search(r"bandwidth\s+(\d+)", if_config)
-        if bw_match:
-            data['interfaces'][if_name]['bandwidth'] = int(bw_match.group(1))
-        # Inside the 'for if_name, if_config in interface_blocks:' loop
-
-        # Extract MTU
-        mtu_match = re.search(r"mtu\s+(\d+)", if_config)
-        if mtu_match:
-            data['interfaces'][if_name]['mtu'] = int(mtu_match.group(1))
-
-    return data
\ No newline at end of file
+    current = None  # Attributes of the interface block we are inside, if any
+
+    for line in lines:
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if stripped[0] == '!':
+            # A '!' line closes the current interface block
+            current = None
+            continue
+
+        keyword = stripped.split(None, 1)[0]
+        if current is not None and line[0].isspace():
+            # Indented lines belong to the open interface block
+            if keyword == 'ip':
+                match = IP_ADDRESS_RE.match(stripped)
+                if match and 'ip' not in current:
+                    current['ip'] = match.group(1)
+                    current['mask'] = match.group(2)
+            elif keyword == 'bandwidth':
+                match = BANDWIDTH_RE.match(stripped)
+                if match and 'bandwidth' not in current:
+                    current['bandwidth'] = int(match.group(1))
+            elif keyword == 'mtu':
+                match = MTU_RE.match(stripped)
+                if match and 'mtu' not in current:
+                    current['mtu'] = int(match.group(1))
+            continue
+
+        current = None
+        if keyword == 'hostname':
+            match = HOSTNAME_RE.match(stripped)
+            if match and 'hostname' not in data:
+                data['hostname'] = match.group(1)
+        elif keyword == 'interface':
+            match = INTERFACE_RE.match(stripped)
+            if match:
+                current = data['interfaces'].setdefault(match.group(1), {})
+        elif keyword == 'ip':
+            match = STATIC_ROUTE_RE.match(stripped)
+            if match:
+                network, mask, next_hop = match.groups()
+                data.setdefault('static_routes', []).append({'network': network, 'mask': mask, 'next_hop': next_hop})
+                # The first static default route doubles as the default gateway
+                if network == '0.0.0.0' and mask == '0.0.0.0' and 'default_gateway' not in data:
+                    data['default_gateway'] = next_hop
+
+    return data
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+from .device import RouterCore, HELLO_INTERVAL, NEIGHBOR_TIMEOUT
+from .engine import SimulationEngine
+
+log = logging.getLogger(__name__)
+
+class AsyncRouter(RouterCore):
+    """A router driven by a shared asyncio event loop.
+
+    It only wakes up when a packet lands in its queue or one of its timers
+    fires, so an idle router costs nothing between events.
+    """
+    def __init__(self, device_id, config, incoming_queue, outgoing_links):
+        super().__init__(device_id, config, outgoing_links, clock=asyncio.get_running_loop().time)
+        self.incoming_queue = incoming_queue
+
+        self.is_running = True
+        self.pause_event = asyncio.Event()
+        self.pause_event.set()
+
+        self._task = None
+        self._timers = {}
+
+    def _send(self, link, packet):
+        link.put_nowait(packet)
+
+    def start(self):
+        log.info("[%s] Booting up...", self.device_id)
+        self._task = asyncio.get_running_loop().create_task(self._receive())
+        # The first HELLO goes out immediately, the first liveness check after half a timeout
+        self._schedule('hello', 0, self._hello_timer)
+        self._schedule('liveness', NEIGHBOR_TIMEOUT / 2, self._liveness_timer)
+
+    def _schedule(self, name, delay, callback):
+        self._timers[name] = asyncio.get_running_loop().call_later(delay, callback)
+
+    def _hello_timer(self):
+        if self.pause_event.is_set():
+            self._send_hello_packets()
+        self._schedule('hello', HELLO_INTERVAL, self._hello_timer)
+
+    def _liveness_timer(self):
+        if self.pause_event.is_set():
+            self._check_neighbor_liveness()
+        self._schedule('liveness', NEIGHBOR_TIMEOUT / 2, self._liveness_timer)
+
+    async def _receive(self):
+        while self.is_running:
+            packet = await self.incoming_queue.get()
+            await self.pause_event.wait()
+            self._process_packet(packet)
+
+    def stop(self):
+        self.is_running = False
+        for handle in self._timers.values():
+            handle.cancel()
+        if self._task:
+            self._task.cancel()
+
+class AsyncSimulationEngine(SimulationEngine):
+    """Runs every router on a single asyncio event loop connected by in-process queues."""
+    def _make_queue(self):
+        return asyncio.Queue()
+
+    def _make_router(self, node_id, node_data, incoming_queue, outgoing_links):
+        return AsyncRouter(node_id, node_data, incoming_queue, outgoing_links)
+
+    def _now(self):
+        return asyncio.get_running_loop().time()
+
+    def _inject(self, device_id, packet):
+        self.incoming_queues[device_id].put_nowait(packet)
+
+    def run(self):
+        asyncio.run(self._run())
+
+    async def _run(self):
+        self.setup()
+        for device in self.devices.values():
+            device.start()
+
+        log.info("--- Network settling, please wait 2 seconds... ---")
+        await asyncio.sleep(2)
+
+        log.info("\n--- Simulation Running. Type 'help' for commands. ---")
+        loop = asyncio.get_running_loop()
+        try:
+            # Read commands on a helper thread so the routers keep running meanwhile
+            while self.execute(await loop.run_in_executor(None, input, "> ")):
+                pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        log.info("--- Stopping simulation... ---")
+        for device in self.devices.values(): device.stop()
+        self._record_metrics()
+        log.info("--- Simulation Stopped ---")
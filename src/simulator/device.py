@@ -1,46 +1,339 @@
+import logging
 import threading
 import time
+from ..iftable import ip_to_int, int_to_ip, mask_to_prefixlen, prefix_mask
+from .spf import ShortestPathTree
+from .rib import RoutingTable
+from .packet import (DATA, PING_REQUEST, PING_REPLY, OSPF_HELLO, LSA, TTL_OFFSET, SRC_IP, DST_IP, new_packet, source,
+                     with_source, encode_hello, decode_hello, encode_lsa, lsa_header, lsa_body)
 
 NEIGHBOR_TIMEOUT = 5  # Time before a silent neighbor is considered down
 HELLO_INTERVAL = 2    # Time between sending HELLO packets
+LINK_COST = 1         # Cost advertised in LSAs for every adjacency
+DEFAULT_TTL = 64      # Hops a packet may take before it is dropped
+FORWARDING_CACHE_SIZE = 65536 # Destinations remembered before the cache starts over
 
-class Router(threading.Thread):
-    def __init__(self, device_id, config, incoming_queue, outgoing_links):
-        super().__init__()
+log = logging.getLogger(__name__)
+
+class RouterCore:
+    """Protocol state and packet handling shared by the routers of every engine.
+
+    Subclasses decide how the router is scheduled and how a packet is put on a
+    link by overriding _send; the clock is injectable for the same reason.
+    """
+    def __init__(self, device_id, config, outgoing_links, clock=time.time):
         self.device_id = device_id
         self.config = config
-        self.incoming_queue = incoming_queue
         self.outgoing_links = outgoing_links
-        
+        self.clock = clock
+
+        self.neighbor_liveness = {}
+        self.arp = {}  # Neighbor address -> neighbor, learned from their HELLOs
+        self.forwarding_cache = {} # Destination address -> next hop, flushed whenever routing changes
+
+        # Seed the routing table with connected subnets and static routes
+        self.routing_table = RoutingTable()
+        self.addresses = []
+        self.connected = []
+        for if_data in config.get('interfaces', {}).values():
+            try:
+                address, prefixlen = ip_to_int(if_data['ip']), mask_to_prefixlen(if_data['mask'])
+            except (KeyError, ValueError):
+                continue # Unaddressed or invalid interface
+            self.addresses.append(address)
+            self.connected.append((address & prefix_mask(prefixlen), prefixlen))
+            self.routing_table.add_connected(*self.connected[-1])
+        self.local_addresses = set(self.addresses)
+        self.hello = encode_hello(device_id, self.addresses)
+        self.down_prefixes = set() # Connected subnets whose only neighbors timed out
+        static_routes = config.get('static_routes')
+        if static_routes is None and config.get('default_gateway'):
+            static_routes = [{'network': '0.0.0.0', 'mask': '0.0.0.0', 'next_hop': config['default_gateway']}]
+        for route in static_routes or []:
+            try:
+                self.routing_table.add_static(ip_to_int(route['network']), mask_to_prefixlen(route['mask']),
+                                              ip_to_int(route['next_hop']))
+            except ValueError:
+                continue # Routes out of an interface rather than to a next-hop address aren't modeled
+
+        # Link-state database: origin -> (sequence number, {neighbor: cost}, [(prefix, prefix length)])
+        self.lsdb = {}
+        self.lsa_packets = {} # origin -> its LSA as we last flooded it, replayed to new neighbors
+        self.lsa_seq = 0
+        self.spf = ShortestPathTree(self.device_id)
+        self.stats = {'lsas_originated': 0, 'lsas_received': 0, 'lsas_flooded': 0, 'route_changes': 0,
+                      'data_received': 0, 'data_forwarded': 0, 'data_dropped': 0}
+        self.last_route_change = None
+
+    def counters(self):
+        """Returns this router's protocol counters, including SPF runs."""
+        return dict(self.stats, spf_full_runs=self.spf.full_runs, spf_incremental_runs=self.spf.incremental_runs,
+                    routes=len(self.routing_table))
+
+    def _send(self, link, packet):
+        """Puts a packet on an outgoing link."""
+        link.put(packet)
+
+    def _send_to_neighbor(self, neighbor, packet):
+        if neighbor in self.outgoing_links:
+            try:
+                self._send(self.outgoing_links[neighbor], packet)
+            except (OSError, ValueError): # This can happen if a link was just failed
+                pass
+
+    def _originate_lsa(self):
+        """Advertises this router's current adjacencies to the whole network."""
+        self.lsa_seq += 1
+        self.stats['lsas_originated'] += 1
+        links = {neighbor: LINK_COST for neighbor in self.neighbor_liveness}
+        prefixes = [prefix for prefix in self.connected if prefix not in self.down_prefixes]
+        self._install_lsa(self.device_id, self.lsa_seq, links, prefixes)
+        packet = self.lsa_packets[self.device_id] = encode_lsa(self.device_id, self.device_id, self.lsa_seq, links, prefixes)
+        self._flood(packet)
+
+    def _flood(self, packet, exclude=None):
+        # Every neighbor gets the same immutable buffer
+        for neighbor in list(self.neighbor_liveness):
+            if neighbor != exclude:
+                self.stats['lsas_flooded'] += 1
+                self._send_to_neighbor(neighbor, packet)
+
+    def _sync_database(self, neighbor):
+        """Sends a newly adjacent neighbor every LSA we know about."""
+        for packet in list(self.lsa_packets.values()):
+            self._send_to_neighbor(neighbor, packet)
+
+    def _usable_cost(self, u, v):
+        """Returns the cost of link u->v if both ends advertise it, otherwise None."""
+        u_lsa, v_lsa = self.lsdb.get(u), self.lsdb.get(v)
+        if u_lsa is None or v_lsa is None or u not in v_lsa[1]:
+            return None
+        return u_lsa[1].get(v)
+
+    def _install_lsa(self, origin, seq, links, prefixes):
+        """Stores an LSA, patches the SPF tree for the links it changed and the routing table for its prefixes."""
+        old_links, old_prefixes = self.lsdb[origin][1:] if origin in self.lsdb else ({}, [])
+        self.lsdb[origin] = (seq, links, prefixes)
+        self.forwarding_cache.clear()
+
+        # Our own subnets are already in the table as connected routes
+        if origin != self.device_id and old_prefixes != prefixes:
+            old_prefixes, prefixes = set(map(tuple, old_prefixes)), set(map(tuple, prefixes))
+            self.routing_table.withdraw(origin, old_prefixes - prefixes)
+            self.routing_table.advertise(origin, prefixes - old_prefixes)
+
+        changes = []
+        for neighbor in set(old_links) | set(links):
+            for u, v in ((origin, neighbor), (neighbor, origin)):
+                cost = self._usable_cost(u, v)
+                if cost != self.spf.adjacency.get(u, {}).get(v):
+                    changes.append((u, v, cost))
+
+        # Prefixes resolve their next hop through the tree, so they need no updating here
+        affected = self.spf.apply_changes(changes)
+        if affected:
+            self.stats['route_changes'] += len(affected)
+            self.last_route_change = self.clock()
+
+    def _check_neighbor_liveness(self):
+        now = self.clock()
+        timed_out_neighbors = []
+        # Use a copy of the keys to avoid issues when deleting during iteration
+        for neighbor in list(self.neighbor_liveness.keys()):
+            if now - self.neighbor_liveness[neighbor] > NEIGHBOR_TIMEOUT:
+                timed_out_neighbors.append(neighbor)
+
+        for neighbor in timed_out_neighbors:
+            log.info("[%s] Link to %s timed out. Removing route.", self.device_id, neighbor)
+            if neighbor in self.neighbor_liveness: del self.neighbor_liveness[neighbor]
+            if neighbor in self.outgoing_links: del self.outgoing_links[neighbor]
+        if timed_out_neighbors:
+            lost = [address for address, n in self.arp.items() if n in timed_out_neighbors]
+            for address in lost:
+                del self.arp[address]
+            self.forwarding_cache.clear()
+            # A link subnet with nobody left on the other end is no longer advertised
+            live = {prefix for address in self.arp for prefix in self._connected_prefixes(address)}
+            for address in lost:
+                self.down_prefixes.update(p for p in self._connected_prefixes(address) if p not in live)
+
+        # Routes through the lost neighbors are withdrawn once our new LSA reaches SPF
+        if timed_out_neighbors:
+            self._originate_lsa()
+
+    def _send_hello_packets(self):
+        """Sends our HELLO packet to all current neighbors."""
+        for link in list(self.outgoing_links.values()):
+            try:
+                self._send(link, self.hello)
+            except (OSError, ValueError): # This can happen if a link was just failed
+                pass
+
+    def _connected_prefixes(self, address):
+        """Returns the connected subnets an address falls in."""
+        return [(network, prefixlen) for network, prefixlen in self.connected
+                if address & prefix_mask(prefixlen) == network]
+
+    def best_origin(self, route):
+        """Returns (cost, router) for the nearest reachable router advertising a route, or None."""
+        dist = self.spf.dist
+        return min(((dist[origin], origin) for origin in route.origins if origin in dist and origin != self.device_id),
+                   default=None)
+
+    def next_hop(self, address):
+        """Returns the neighbor to forward a packet for an address to, or None if there is no usable route.
+
+        The longest matching prefix wins. A connected subnet delivers straight
+        to the neighbor owning the address; a static route whose next hop is
+        down or a prefix whose advertisers are unreachable falls back to the
+        next shorter match. Answers are cached per destination until routing
+        changes.
+        """
+        neighbor = self.forwarding_cache.get(address)
+        if neighbor in self.outgoing_links:
+            return neighbor
+        neighbor = self._lookup(address)
+        if neighbor is not None:
+            if len(self.forwarding_cache) >= FORWARDING_CACHE_SIZE:
+                self.forwarding_cache.clear()
+            self.forwarding_cache[address] = neighbor
+        return neighbor
+
+    def _lookup(self, address):
+        for prefix, prefixlen, route in self.routing_table.matches(address):
+            if route.connected and (prefix, prefixlen) not in self.down_prefixes:
+                neighbor = self.arp.get(address)
+                return neighbor if neighbor in self.outgoing_links else None
+            if route.static is not None:
+                neighbor = self.arp.get(route.static)
+                if neighbor in self.outgoing_links:
+                    return neighbor
+            best = self.best_origin(route)
+            if best is not None:
+                return self.spf.first_hop[best[1]]
+        return None
+
+    def _forward(self, packet, destination):
+        """Sends a unicast packet one hop towards its destination address. Returns the next hop, or None if it was dropped.
+
+        The packet is passed on as is, with its TTL decremented in place.
+        """
+        if packet[TTL_OFFSET] <= 1:
+            return None
+        neighbor = self.next_hop(destination)
+        if neighbor is not None:
+            packet[TTL_OFFSET] -= 1
+            self._send_to_neighbor(neighbor, packet)
+        return neighbor
+
+    def _deliver(self, packet):
+        """Hands a DATA packet addressed to this router to whatever is measuring the traffic."""
+
+    def _process_packet(self, packet):
+        ptype = packet[0]
+
+        # Data packets dominate under load, so they are matched first, only their
+        # destination is decoded and they are never printed
+        if ptype == DATA:
+            destination = DST_IP.unpack_from(packet)[0]
+            if destination in self.local_addresses:
+                self.stats['data_received'] += 1
+                self._deliver(packet)
+            elif self._forward(packet, destination) is None:
+                self.stats['data_dropped'] += 1
+            else:
+                self.stats['data_forwarded'] += 1
+
+        elif ptype == OSPF_HELLO:
+            sender, addresses = decode_hello(packet)
+            if sender == self.device_id: return
+            is_new_neighbor = sender not in self.neighbor_liveness
+            # Always update the liveness timer when we hear from a neighbor
+            self.neighbor_liveness[sender] = self.clock()
+            if is_new_neighbor:
+                log.info("[%s] Established link with %s", self.device_id, sender)
+                for address in addresses:
+                    self.arp[address] = sender
+                    self.down_prefixes.difference_update(self._connected_prefixes(address))
+                self.forwarding_cache.clear()
+                self._sync_database(sender)
+                self._originate_lsa()
+
+        elif ptype == LSA:
+            self.stats['lsas_received'] += 1
+            # Duplicates are the common case in a flood; they're recognized without decoding the body
+            origin, seq = lsa_header(packet)
+            if origin == self.device_id:
+                # A stale copy of our own LSA, e.g. from before a restart: jump past it
+                if seq > self.lsa_seq:
+                    self.lsa_seq = seq
+                    self._originate_lsa()
+                return
+            if origin in self.lsdb and self.lsdb[origin][0] >= seq:
+                return # Already have this LSA or a newer one
+            self._install_lsa(origin, seq, *lsa_body(packet))
+            flooded = self.lsa_packets[origin] = with_source(packet, self.device_id)
+            self._flood(flooded, exclude=source(packet))
+
+        elif ptype == PING_REQUEST:
+            destination, sender_ip = DST_IP.unpack_from(packet)[0], SRC_IP.unpack_from(packet)[0]
+            if destination in self.local_addresses:
+                log.info("[%s] Received PING from %s (%s). Sending reply.", self.device_id, int_to_ip(sender_ip),
+                         source(packet))
+                self._forward(new_packet(PING_REPLY, self.device_id, DEFAULT_TTL, src_ip=destination, dst_ip=sender_ip),
+                              sender_ip)
+            elif packet[TTL_OFFSET] <= 1:
+                log.info("[%s] TTL expired for %s, dropping PING.", self.device_id, int_to_ip(destination))
+            else:
+                next_hop = self._forward(packet, destination)
+                if next_hop is not None:
+                    log.info("[%s] Forwarding PING for %s via %s", self.device_id, int_to_ip(destination), next_hop)
+                else:
+                    log.info("[%s] No route to %s, dropping PING.", self.device_id, int_to_ip(destination))
+
+        elif ptype == PING_REPLY:
+            destination = DST_IP.unpack_from(packet)[0]
+            if destination in self.local_addresses:
+                log.info("[%s] Successfully received PING_REPLY from %s (%s)", self.device_id,
+                         int_to_ip(SRC_IP.unpack_from(packet)[0]), source(packet))
+            else:
+                # Replies from routers several hops away are routed back like requests
+                self._forward(packet, destination)
+
+class Router(RouterCore, threading.Thread):
+    """A router running in its own thread, polling its incoming queue."""
+    def __init__(self, device_id, config, incoming_queue, outgoing_links):
+        threading.Thread.__init__(self)
+        RouterCore.__init__(self, device_id, config, outgoing_links)
+        self.incoming_queue = incoming_queue
+
         self.is_running = True
         self.pause_event = threading.Event()
         self.pause_event.set()
-        
-        self.routing_table = {self.device_id: (None, 0)}
-        self.neighbor_liveness = {}
+
         self.last_check_time = time.time()
         self.last_hello_time = 0 # Initialize to ensure first HELLO is sent immediately
 
     def run(self):
-        print(f"[{self.device_id}] Booting up...")
+        log.info("[%s] Booting up...", self.device_id)
 
         while self.is_running:
             self.pause_event.wait()
-            
+
             # --- THIS IS THE FIX ---
             # Periodically send out HELLO packets to all neighbors
             if time.time() - self.last_hello_time > HELLO_INTERVAL:
                 self._send_hello_packets()
                 self.last_hello_time = time.time()
 
-            # Check for incoming packets
+            # Drain incoming packets; LSA floods can queue several at once
             try:
-                if not self.incoming_queue.empty():
+                while not self.incoming_queue.empty():
                     packet = self.incoming_queue.get()
                     self._process_packet(packet)
             except (OSError, ValueError):
                 pass
-            
+
             # Periodically check if neighbors have timed out
             if time.time() - self.last_check_time > NEIGHBOR_TIMEOUT / 2:
                 self._check_neighbor_liveness()
@@ -50,57 +343,3 @@ class Router(threading.Thread):
 
     def stop(self):
         self.is_running = False
-
-    def _check_neighbor_liveness(self):
-        timed_out_neighbors = []
-        # Use a copy of the keys to avoid issues when deleting during iteration
-        for neighbor in list(self.neighbor_liveness.keys()):
-            if time.time() - self.neighbor_liveness[neighbor] > NEIGHBOR_TIMEOUT:
-                timed_out_neighbors.append(neighbor)
-        
-        for neighbor in timed_out_neighbors:
-            print(f"[{self.device_id}] Link to {neighbor} timed out. Removing route.")
-            if neighbor in self.routing_table: del self.routing_table[neighbor]
-            if neighbor in self.neighbor_liveness: del self.neighbor_liveness[neighbor]
-            if neighbor in self.outgoing_links: del self.outgoing_links[neighbor]
-
-    def _send_hello_packets(self):
-        """Sends a HELLO packet to all current neighbors."""
-        for neighbor_queue in self.outgoing_links.values():
-            try:
-                neighbor_queue.put({'type': 'OSPF_HELLO', 'source': self.device_id})
-            except (OSError, ValueError): # This can happen if a link was just failed
-                pass
-
-    def _process_packet(self, packet):
-        ptype = packet.get('type')
-        source = packet.get('source')
-
-        if ptype == 'OSPF_HELLO':
-            if source == self.device_id: return
-            # Always update the liveness timer when we hear from a neighbor
-            self.neighbor_liveness[source] = time.time()
-            if source not in self.routing_table:
-                print(f"[{self.device_id}] Established link with {source}")
-                self.routing_table[source] = (source, 1)
-
-        elif ptype == 'PING_REQUEST':
-            destination = packet.get('destination')
-            if destination == self.device_id:
-                print(f"[{self.device_id}] Received PING from {source}. Sending reply.")
-                reply = {'type': 'PING_REPLY', 'source': self.device_id, 'destination': source}
-                if source in self.routing_table:
-                    next_hop, _ = self.routing_table[source]
-                    if next_hop in self.outgoing_links:
-                        self.outgoing_links[next_hop].put(reply)
-            else:
-                if destination in self.routing_table:
-                    next_hop, _ = self.routing_table[destination]
-                    if next_hop in self.outgoing_links:
-                        print(f"[{self.device_id}] Forwarding PING for {destination} via {next_hop}")
-                        self.outgoing_links[next_hop].put(packet)
-                else:
-                    print(f"[{self.device_id}] No route to {destination}, dropping PING.")
-
-        elif ptype == 'PING_REPLY':
-            print(f"[{self.device_id}] Successfully received PING_REPLY from {source}")
\ No newline at end of file
@@ -1,63 +1,191 @@
+import logging
 import time
 from multiprocessing import Queue
-from .device import Router
+from ..iftable import ip_to_int, int_to_ip
+from ..instrument import METRICS
+from .device import Router, DEFAULT_TTL
+from .packet import PING_REQUEST, new_packet
+
+log = logging.getLogger(__name__)
+
+HELP_TEXT = ("Commands: ping <src> <dst router or IP>, fail link <d1> <d2>, stats [router], routes <router>, "
+             "pause, resume, exit")
 
 class SimulationEngine:
     def __init__(self, graph):
         self.graph = graph
         self.devices = {}
+        self.last_topology_change = None
         # Each device gets one incoming queue, identified by its name
-        self.incoming_queues = {node_id: Queue() for node_id in graph.nodes()}
+        self.incoming_queues = {node_id: self._make_queue() for node_id in graph.nodes()}
+
+    def _make_queue(self):
+        return Queue()
+
+    def _make_router(self, node_id, node_data, incoming_queue, outgoing_links):
+        return Router(node_id, node_data, incoming_queue, outgoing_links)
+
+    def _router_config(self, node_id, node_data):
+        """Returns a device's config for its router, with its interfaces from the graph's InterfaceTable."""
+        table = self.graph.graph.get('interfaces')
+        if table is None:
+            return node_data
+        return dict(node_data, interfaces=table.interfaces_of(node_id))
+
+    def _now(self):
+        """Returns the current time on the routers' clock."""
+        return time.time()
+
+    def _inject(self, device_id, packet):
+        """Places a packet in a device's IN-queue from outside the network."""
+        self.incoming_queues[device_id].put(packet)
 
     def setup(self):
         """Sets up devices with one incoming queue and a dict of outgoing queues."""
         for node_id, node_data in self.graph.nodes(data=True):
             # A device's outgoing links are the incoming queues of its neighbors
             outgoing_links = {
-                neighbor: self.incoming_queues[neighbor] 
+                neighbor: self.incoming_queues[neighbor]
                 for neighbor in self.graph.neighbors(node_id)
             }
-            
+
             # Each device gets its own dedicated incoming queue
             incoming_queue = self.incoming_queues[node_id]
-            
-            self.devices[node_id] = Router(node_id, node_data, incoming_queue, outgoing_links)
+
+            config = self._router_config(node_id, node_data)
+            self.devices[node_id] = self._make_router(node_id, config, incoming_queue, outgoing_links)
 
     def run(self):
         self.setup()
         for device in self.devices.values():
             device.start()
 
-        print("--- Network settling, please wait 2 seconds... ---")
+        log.info("--- Network settling, please wait 2 seconds... ---")
         time.sleep(2)
-        
-        print("\n--- Simulation Running. Type 'help' for commands. ---")
+
+        log.info("\n--- Simulation Running. Type 'help' for commands. ---")
         try:
-            while True:
-                cmd = input("> ").strip().lower().split()
-                if not cmd: continue
-
-                if cmd[0] == 'exit': break
-                elif cmd[0] == 'pause': self.pause()
-                elif cmd[0] == 'resume': self.resume()
-                elif cmd[0] == 'ping' and len(cmd) == 3: self.ping(cmd[1].upper(), cmd[2].upper())
-                elif cmd[0] == 'fail' and len(cmd) == 4 and cmd[1] == 'link': self.fail_link(cmd[2].upper(), cmd[3].upper())
-                elif cmd[0] == 'help': print("Commands: ping <src> <dst>, fail link <d1> <d2>, pause, resume, exit")
-                else: print("Unknown command.")
+            while self.execute(input("> ")):
+                pass
         finally:
             self.stop()
 
+    def execute(self, line):
+        """Runs one interactive command. Returns False once the user asks to exit."""
+        cmd = line.strip().lower().split()
+        if not cmd: return True
+
+        if cmd[0] == 'exit': return False
+        elif cmd[0] == 'pause': self.pause()
+        elif cmd[0] == 'resume': self.resume()
+        elif cmd[0] == 'ping' and len(cmd) == 3: self.ping(cmd[1].upper(), cmd[2].upper())
+        elif cmd[0] == 'fail' and len(cmd) == 4 and cmd[1] == 'link': self.fail_link(cmd[2].upper(), cmd[3].upper())
+        elif cmd[0] == 'stats' and len(cmd) <= 2: self.show_stats(cmd[1].upper() if len(cmd) == 2 else None)
+        elif cmd[0] == 'routes' and len(cmd) == 2: self.show_routes(cmd[1].upper())
+        elif cmd[0] == 'help': print(HELP_TEXT)
+        else: print("Unknown command.")
+        return True
+
+    def _first_address(self, device_id):
+        """Returns a device's first interface address as an integer, or None if it has none."""
+        if device_id in self.devices:
+            addresses = self.devices[device_id].addresses
+            return addresses[0] if addresses else None
+        # Devices simulated elsewhere, e.g. in another shard, are looked up in the graph
+        table = self.graph.graph.get('interfaces')
+        for row in table.rows_of(device_id) if table is not None else ():
+            if table.is_addressed(row):
+                return table.ip[row]
+        return None
+
+    def _resolve_address(self, dest):
+        """Returns the integer address of an IP string, or of a router's first address. None if neither."""
+        try:
+            return ip_to_int(dest)
+        except ValueError:
+            pass
+        return self._first_address(dest) if dest in self.graph else None
+
     def ping(self, source, dest):
-        """Initiates a ping from the engine by placing it in the source's IN-queue."""
-        if source in self.devices:
-            print(f"--- Sending PING from {source} to {dest} ---")
-            packet = {'type': 'PING_REQUEST', 'source': source, 'destination': dest, 'sender': 'ENGINE'}
-            self.incoming_queues[source].put(packet)
-        else:
+        """Initiates a ping from the engine by placing it in the source's IN-queue.
+
+        dest is either an IP address or a router, which is pinged at its first address.
+        """
+        if source not in self.graph:
             print(f"Error: Source device {source} not found.")
+            return
+        src_ip = self._first_address(source)
+        if src_ip is None:
+            print(f"Error: Source device {source} has no IP address.")
+            return
+        dst_ip = self._resolve_address(dest)
+        if dst_ip is None:
+            print(f"Error: Destination {dest} is neither an IP address nor an addressed device.")
+            return
+        log.info("--- Sending PING from %s to %s (%s) ---", source, dest, int_to_ip(dst_ip))
+        self._inject(source, new_packet(PING_REQUEST, source, DEFAULT_TTL, src_ip=src_ip, dst_ip=dst_ip))
+
+    def show_routes(self, device_id):
+        """Prints a router's routing table and the path each prefix currently takes."""
+        if device_id not in self.devices:
+            print(f"Error: Device {device_id} not found.")
+            return
+        device = self.devices[device_id]
+        print(f"{'Prefix':<20}{'Source':<12}{'Next hop':<16}{'Cost':>6}")
+        for prefix, prefixlen, route in device.routing_table.routes():
+            network = f"{int_to_ip(prefix)}/{prefixlen}"
+            best = device.best_origin(route)
+            if route.connected:
+                print(f"{network:<20}{'connected':<12}{'-':<16}{0:>6}")
+            elif route.static is not None:
+                print(f"{network:<20}{'static':<12}{int_to_ip(route.static):<16}{'-':>6}")
+            elif best is not None:
+                print(f"{network:<20}{best[1]:<12}{device.spf.first_hop[best[1]]:<16}{best[0]:>6}")
+            else:
+                print(f"{network:<20}{', '.join(route.origins):<12}{'unreachable':<16}{'-':>6}")
+
+    def _router_counters(self):
+        """Returns ({router: counters}, [time of each router's last route change])."""
+        counters = {name: device.counters() for name, device in self.devices.items()}
+        route_changes = [d.last_route_change for d in self.devices.values() if d.last_route_change is not None]
+        return counters, route_changes
+
+    def _record_metrics(self):
+        """Adds the routers' protocol and forwarding counters to METRICS, once the simulation is over."""
+        counters, _ = self._router_counters()
+        for router_counters in counters.values():
+            for name, value in router_counters.items():
+                if name != 'routes':
+                    METRICS.count(f'sim_{name}', value)
+        METRICS.gauge('sim_routes', sum(c['routes'] for c in counters.values()))
+
+    def show_stats(self, device_id=None):
+        """Prints routing protocol counters per router and the last convergence time."""
+        if device_id and device_id not in self.graph:
+            print(f"Error: Device {device_id} not found.")
+            return
+        counters, route_changes = self._router_counters()
+        if device_id:
+            counters = {device_id: counters[device_id]}
+        print(f"{'Router':<12}{'Routes':>8}{'SPF full':>10}{'SPF incr':>10}{'LSAs orig':>11}{'LSAs rcvd':>11}{'LSAs sent':>11}")
+        for name, c in sorted(counters.items()):
+            print(f"{name:<12}{c['routes']:>8}{c['spf_full_runs']:>10}{c['spf_incremental_runs']:>10}"
+                  f"{c['lsas_originated']:>11}{c['lsas_received']:>11}{c['lsas_flooded']:>11}")
+
+        if self.last_topology_change is None or not route_changes:
+            return
+        converged_at = max(route_changes)
+        if converged_at >= self.last_topology_change:
+            print(f"Routes converged {converged_at - self.last_topology_change:.3f}s after the last link failure.")
+        else:
+            print("No route changes since the last link failure yet.")
 
     def fail_link(self, d1, d2):
-        print(f"--- Simulating link failure between {d1} and {d2} ---")
+        log.info("--- Simulating link failure between %s and %s ---", d1, d2)
+        self.last_topology_change = self._now()
+        self._cut_link(d1, d2)
+
+    def _cut_link(self, d1, d2):
         # To fail a link, we tell each device to remove the other from its outgoing links
         if d1 in self.devices and d2 in self.devices[d1].outgoing_links:
             del self.devices[d1].outgoing_links[d2]
@@ -65,15 +193,16 @@ class SimulationEngine:
             del self.devices[d2].outgoing_links[d1]
 
     def pause(self):
-        print("--- Pausing simulation... ---")
+        log.info("--- Pausing simulation... ---")
         for device in self.devices.values(): device.pause_event.clear()
 
     def resume(self):
-        print("--- Resuming simulation... ---")
+        log.info("--- Resuming simulation... ---")
         for device in self.devices.values(): device.pause_event.set()
 
     def stop(self):
-        print("--- Stopping simulation... ---")
+        log.info("--- Stopping simulation... ---")
         for device in self.devices.values(): device.stop()
         for device in self.devices.values(): device.join()
-        print("--- Simulation Stopped ---")
\ No newline at end of file
+        self._record_metrics()
+        log.info("--- Simulation Stopped ---")
@@ -0,0 +1,127 @@
+import struct
+
+# Packet types, the first byte of every packet
+DATA, PING_REQUEST, PING_REPLY, OSPF_HELLO, LSA = range(1, 6)
+UNICAST = (DATA, PING_REQUEST, PING_REPLY)
+
+# Fixed header: type, TTL, size on the wire (0 for control packets), source and
+# destination addresses, flow id and send time of DATA packets. The sending
+# router's name follows as a length byte and UTF-8, then the type's payload.
+HEADER = struct.Struct('!BBHIIId')
+TTL_OFFSET = 1
+NAME_OFFSET = HEADER.size
+
+# Single header fields, with their offsets built in so a read is one C call
+SIZE = struct.Struct('!2xH')
+SRC_IP = struct.Struct('!4xI')
+DST_IP = struct.Struct('!8xI')
+FLOW = struct.Struct('!12xI')
+SENT_AT = struct.Struct('!16xd')
+
+_U16 = struct.Struct('!H')
+_U32 = struct.Struct('!I')
+_LSA_FIXED = struct.Struct('!IHH') # sequence number, link count, prefix count
+_LINK = struct.Struct('!H')        # cost, after the neighbor's name
+_PREFIX = struct.Struct('!IB')
+
+DECODE_CACHE_SIZE = 65536 # Decoded names and HELLOs remembered before the caches start over
+
+_name_fields = {} # router name -> its encoded length-prefixed name
+_names = {}       # encoded name -> router name
+_hellos = {}      # HELLO packet -> (sender, addresses)
+_lsa_bodies = {}  # origin -> (LSA payload, links, prefixes) of the last LSA decoded from it
+
+def _name_field(name):
+    field = _name_fields.get(name)
+    if field is None:
+        encoded = name.encode()
+        if len(encoded) > 255:
+            raise ValueError(f"Router name too long for a packet: {name}")
+        field = _name_fields[name] = bytes((len(encoded),)) + encoded
+    return field
+
+def _read_name(packet, offset):
+    """Returns (name, offset just past it) of the length-prefixed name at offset."""
+    end = offset + 1 + packet[offset]
+    raw = bytes(packet[offset + 1:end])
+    name = _names.get(raw)
+    if name is None:
+        if len(_names) >= DECODE_CACHE_SIZE:
+            _names.clear()
+        name = _names[raw] = raw.decode()
+    return name, end
+
+def new_packet(ptype, source, ttl=0, size=0, src_ip=0, dst_ip=0, flow=0, sent_at=0.0, payload=b''):
+    """Encodes a packet into a new mutable buffer."""
+    return bytearray(HEADER.pack(ptype, ttl, size, src_ip, dst_ip, flow, sent_at) + _name_field(source) + payload)
+
+def source(packet):
+    """Returns the name of the router that sent the packet, or for unicast packets the one that originated it."""
+    return _read_name(packet, NAME_OFFSET)[0]
+
+def _payload_offset(packet):
+    return NAME_OFFSET + 1 + packet[NAME_OFFSET]
+
+def with_source(packet, name):
+    """Returns an immutable copy of a packet with a new sender."""
+    view = memoryview(packet)
+    return b''.join((view[:NAME_OFFSET], _name_field(name), view[_payload_offset(packet):]))
+
+def encode_hello(name, addresses):
+    """Encodes a router's HELLO. It never changes, so one immutable buffer serves every neighbor and interval."""
+    payload = _U16.pack(len(addresses)) + struct.pack(f'!{len(addresses)}I', *addresses)
+    return bytes(new_packet(OSPF_HELLO, name, payload=payload))
+
+def decode_hello(packet):
+    """Returns (sender, addresses) of a HELLO.
+
+    Routers resend the same buffer, which hashes once, so after a router's
+    first HELLO reading its later ones is a single dict lookup.
+    """
+    decoded = _hellos.get(packet)
+    if decoded is None:
+        offset = _payload_offset(packet)
+        count = _U16.unpack_from(packet, offset)[0]
+        if len(_hellos) >= DECODE_CACHE_SIZE:
+            _hellos.clear()
+        decoded = _hellos[packet] = (source(packet), struct.unpack_from(f'!{count}I', packet, offset + _U16.size))
+    return decoded
+
+def encode_lsa(name, origin, seq, links, prefixes):
+    """Encodes an LSA flooded by name: origin's {neighbor: cost} and [(prefix, prefix length)]."""
+    parts = [_name_field(origin), _LSA_FIXED.pack(seq, len(links), len(prefixes))]
+    for neighbor, cost in links.items():
+        parts.append(_name_field(neighbor) + _LINK.pack(cost))
+    parts.extend(_PREFIX.pack(prefix, prefixlen) for prefix, prefixlen in prefixes)
+    return bytes(new_packet(LSA, name, payload=b''.join(parts)))
+
+def lsa_header(packet):
+    """Returns (origin, sequence number) of an LSA without decoding its body."""
+    origin, offset = _read_name(packet, _payload_offset(packet))
+    return origin, _U32.unpack_from(packet, offset)[0]
+
+def lsa_body(packet):
+    """Returns ({neighbor: cost}, [(prefix, prefix length)]) of an LSA.
+
+    A flood brings the same LSA to every router in the process, so the last
+    decoding per origin is kept and reused while the payload is byte for byte
+    the same. Callers must not modify what they get back.
+    """
+    start = _payload_offset(packet)
+    payload = bytes(packet[start:])
+    origin, offset = _read_name(packet, start)
+    cached = _lsa_bodies.get(origin)
+    if cached is not None and cached[0] == payload:
+        return cached[1], cached[2]
+    _, link_count, prefix_count = _LSA_FIXED.unpack_from(packet, offset)
+    offset += _LSA_FIXED.size
+    links = {}
+    for _ in range(link_count):
+        neighbor, offset = _read_name(packet, offset)
+        links[neighbor] = _LINK.unpack_from(packet, offset)[0]
+        offset += _LINK.size
+    prefixes = [_PREFIX.unpack_from(packet, offset + i * _PREFIX.size) for i in range(prefix_count)]
+    if len(_lsa_bodies) >= DECODE_CACHE_SIZE:
+        _lsa_bodies.clear()
+    _lsa_bodies[origin] = (payload, links, prefixes)
+    return links, prefixes
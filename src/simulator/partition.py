@@ -0,0 +1,55 @@
+import networkx as nx
+from networkx.algorithms.community import kernighan_lin_bisection
+
+def partition_graph(graph, parts, seed=0):
+    """Splits a graph's nodes into parts balanced sets with few links between them.
+
+    Recursive Kernighan-Lin bisection: each split starts from a breadth-first
+    ordering cut at the right size, so each side is already mostly connected,
+    and Kernighan-Lin then swaps node pairs to shrink the cut while keeping
+    the sizes. Uneven part counts split proportionally, and asking for more
+    parts than there are nodes gives one node per part.
+
+    Returns {node: part index}.
+    """
+    # With at least as many nodes as parts, every bisection leaves both sides non-empty
+    parts = min(parts, graph.number_of_nodes())
+    assignment = {}
+    _bisect(nx.Graph(graph), parts, 0, assignment, seed)
+    return assignment
+
+def _bisect(graph, parts, first_part, assignment, seed):
+    if parts == 1 or graph.number_of_nodes() <= 1:
+        for node in graph:
+            assignment[node] = first_part
+        return
+    left_parts = parts // 2
+    order = _breadth_first_order(graph)
+    split = len(order) * left_parts // parts
+    left, right = kernighan_lin_bisection(graph, partition=(set(order[:split]), set(order[split:])), seed=seed)
+    if len(left) != split:
+        # The halves keep their sizes but may come back in either order
+        left, right = right, left
+    _bisect(graph.subgraph(left), left_parts, first_part, assignment, seed)
+    _bisect(graph.subgraph(right), parts - left_parts, first_part + left_parts, assignment, seed)
+
+def _breadth_first_order(graph):
+    """Returns every node, one connected component after another, in breadth-first order."""
+    order = []
+    seen = set()
+    for start in sorted(graph, key=str):
+        if start in seen:
+            continue
+        seen.add(start)
+        component = [start]
+        for u in component:
+            for v in sorted(graph[u], key=str):
+                if v not in seen:
+                    seen.add(v)
+                    component.append(v)
+        order.extend(component)
+    return order
+
+def cut_size(graph, assignment):
+    """Returns the number of edges whose ends are in different parts."""
+    return sum(1 for u, v in graph.edges() if assignment[u] != assignment[v])
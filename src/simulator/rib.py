@@ -0,0 +1,240 @@
+from ..iftable import prefix_mask
+
+MASKS = [prefix_mask(prefixlen) for prefixlen in range(33)]
+
+class _Node:
+    __slots__ = ('prefix', 'prefixlen', 'value', 'zero', 'one')
+
+    def __init__(self, prefix, prefixlen, value=None):
+        self.prefix = prefix
+        self.prefixlen = prefixlen
+        self.value = value
+        self.zero = None
+        self.one = None
+
+def _bit(address, position):
+    """Returns bit number position of a 32-bit address, counting from the most significant."""
+    return (address >> (31 - position)) & 1
+
+def _attach(parent, child):
+    if _bit(child.prefix, parent.prefixlen):
+        parent.one = child
+    else:
+        parent.zero = child
+
+class RadixTrie:
+    """A path-compressed binary (Patricia) trie mapping IPv4 prefixes to values.
+
+    Prefixes are (network, prefix length) integer pairs. Only nodes that hold a
+    value or where two branches split exist, so a lookup visits at most one
+    node per distinct prefix length on the path rather than one per bit.
+    Values must not be None; None marks a branching node without an entry.
+    """
+    def __init__(self):
+        self._root = _Node(0, 0)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _node(self, prefix, prefixlen, create=False):
+        """Returns the node of an exact prefix, creating it (and a branching node) if asked."""
+        node = self._root
+        while node.prefixlen != prefixlen:
+            bit = _bit(prefix, node.prefixlen)
+            child = node.one if bit else node.zero
+            if child is None:
+                if not create:
+                    return None
+                child = _Node(prefix, prefixlen)
+                _attach(node, child)
+                return child
+            # Leading bits the child and the prefix agree on, capped at both lengths
+            common = min(child.prefixlen, prefixlen, 32 - (child.prefix ^ prefix).bit_length())
+            if common == child.prefixlen:
+                node = child
+                continue
+            if not create:
+                return None
+            new = _Node(prefix, prefixlen)
+            if common == prefixlen:
+                # The new prefix covers the child, so it slots in above it
+                _attach(new, child)
+                _attach(node, new)
+            else:
+                branch = _Node(prefix & MASKS[common], common)
+                _attach(branch, child)
+                _attach(branch, new)
+                _attach(node, branch)
+            return new
+        return node
+
+    def get(self, prefix, prefixlen, default=None):
+        node = self._node(prefix & MASKS[prefixlen], prefixlen)
+        if node is None or node.value is None:
+            return default
+        return node.value
+
+    def insert(self, prefix, prefixlen, value):
+        node = self._node(prefix & MASKS[prefixlen], prefixlen, create=True)
+        if node.value is None:
+            self._size += 1
+        node.value = value
+
+    def setdefault(self, prefix, prefixlen, factory):
+        """Returns the value of a prefix, first inserting factory() if it has none."""
+        node = self._node(prefix & MASKS[prefixlen], prefixlen, create=True)
+        if node.value is None:
+            node.value = factory()
+            self._size += 1
+        return node.value
+
+    def remove(self, prefix, prefixlen):
+        """Removes a prefix and returns its value, or None if it was not present."""
+        prefix &= MASKS[prefixlen]
+        path = [self._root]
+        node = self._root
+        while node.prefixlen != prefixlen:
+            node = node.one if _bit(prefix, node.prefixlen) else node.zero
+            if node is None or node.prefixlen > prefixlen or (prefix & MASKS[node.prefixlen]) != node.prefix:
+                return None
+            path.append(node)
+        if node.prefix != prefix or node.value is None:
+            return None
+        value, node.value = node.value, None
+        self._size -= 1
+
+        # Splice out nodes left with no value and fewer than two branches
+        while len(path) > 1:
+            node = path.pop()
+            if node.value is not None or (node.zero is not None and node.one is not None):
+                break
+            parent = path[-1]
+            remaining = node.zero or node.one
+            if parent.zero is node:
+                parent.zero = remaining
+            else:
+                parent.one = remaining
+        return value
+
+    def matches(self, address):
+        """Returns every (prefix, prefix length, value) containing an address, longest first."""
+        found = []
+        node = self._root
+        while node is not None and (address & MASKS[node.prefixlen]) == node.prefix:
+            if node.value is not None:
+                found.append((node.prefix, node.prefixlen, node.value))
+            if node.prefixlen == 32:
+                break
+            node = node.one if (address >> (31 - node.prefixlen)) & 1 else node.zero
+        found.reverse()
+        return found
+
+    def lookup(self, address):
+        """Returns the longest (prefix, prefix length, value) containing an address, or None."""
+        found = self.matches(address)
+        return found[0] if found else None
+
+    def items(self):
+        """Yields every (prefix, prefix length, value) in address order, shorter prefixes first."""
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node.value is not None:
+                yield node.prefix, node.prefixlen, node.value
+            stack.extend(child for child in (node.one, node.zero) if child is not None)
+
+    def __getstate__(self):
+        # Nodes are pickled as one flat preorder list, each with flags for the branches that follow it,
+        # rather than as nested objects; it is several times smaller and needs no recursion
+        nodes = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            nodes.append((node.prefix, node.prefixlen, node.value,
+                          (node.zero is not None) | (node.one is not None) << 1))
+            stack.extend(child for child in (node.one, node.zero) if child is not None)
+        return self._size, nodes
+
+    def __setstate__(self, state):
+        self._size, nodes = state
+        parents = [] # (node, branch) pairs still waiting for a child, innermost last
+        for prefix, prefixlen, value, branches in nodes:
+            node = _Node(prefix, prefixlen, value)
+            if parents:
+                parent, branch = parents.pop()
+                setattr(parent, branch, node)
+            else:
+                self._root = node
+            # The zero branch comes first in preorder, so it goes on the stack last
+            if branches & 2:
+                parents.append((node, 'one'))
+            if branches & 1:
+                parents.append((node, 'zero'))
+
+class Route:
+    """Everything a routing table knows about one prefix.
+
+    A prefix can be directly connected, have a static next-hop address and be
+    advertised by any number of routers at once; the router picks which of
+    them to use when it forwards.
+    """
+    __slots__ = ('connected', 'static', 'origins')
+
+    def __init__(self):
+        self.connected = False
+        self.static = None  # Next-hop address as an integer
+        self.origins = ()   # Routers whose LSAs advertise the prefix
+
+    def is_empty(self):
+        return not self.connected and self.static is None and not self.origins
+
+    def __getstate__(self):
+        return self.connected, self.static, self.origins
+
+    def __setstate__(self, state):
+        self.connected, self.static, self.origins = state
+
+class RoutingTable:
+    """A router's prefixes in a RadixTrie, with longest-prefix-match lookup.
+
+    Routes learned from LSAs name the routers that advertise them instead of a
+    next hop. Next hops are resolved through the SPF tree when a packet is
+    forwarded, so a topology change that moves paths only touches the tree,
+    never the prefixes behind it.
+    """
+    def __init__(self):
+        self.trie = RadixTrie()
+
+    def __len__(self):
+        return len(self.trie)
+
+    def add_connected(self, prefix, prefixlen):
+        self.trie.setdefault(prefix, prefixlen, Route).connected = True
+
+    def add_static(self, prefix, prefixlen, next_hop):
+        self.trie.setdefault(prefix, prefixlen, Route).static = next_hop
+
+    def advertise(self, origin, prefixes):
+        """Installs many (prefix, prefix length) pairs as advertised by one router."""
+        setdefault = self.trie.setdefault
+        for prefix, prefixlen in prefixes:
+            route = setdefault(prefix, prefixlen, Route)
+            if origin not in route.origins:
+                route.origins += (origin,)
+
+    def withdraw(self, origin, prefixes):
+        """Removes one router's advertisement of many prefixes, dropping routes nothing else provides."""
+        for prefix, prefixlen in prefixes:
+            route = self.trie.get(prefix, prefixlen)
+            if route is None or origin not in route.origins:
+                continue
+            route.origins = tuple(o for o in route.origins if o != origin)
+            if route.is_empty():
+                self.trie.remove(prefix, prefixlen)
+
+    def matches(self, address):
+        return self.trie.matches(address)
+
+    def routes(self):
+        return self.trie.items()
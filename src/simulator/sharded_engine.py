@@ -0,0 +1,404 @@
+import contextlib
+import io
+import logging
+import multiprocessing
+import os
+import struct
+import time
+import traceback
+from multiprocessing.shared_memory import SharedMemory
+from ..instrument import METRICS
+from .virtual_engine import VirtualSimulationEngine, VirtualRouter, VirtualLink, LINK_DELAY, SETTLE_TIME
+from .snapshot import SnapshotError
+from .partition import partition_graph, cut_size
+from .packet import UNICAST
+
+log = logging.getLogger(__name__)
+
+RING_CAPACITY = 1 << 20 # Bytes of shared memory per direction between two shards
+RING_HEADER = struct.Struct('QQ') # Total bytes ever written and read
+RECORD_HEADER = struct.Struct('I')
+TRANSIT_HEADER = struct.Struct('=dII') # Arrival time, target router index and length of a packet between shards
+
+SNAPSHOT_UNSUPPORTED = "Snapshots need --engine virtual; record and replay the command log instead"
+
+class ShmRing:
+    """A single-producer, single-consumer byte ring in shared memory.
+
+    The write and read positions only ever grow, so each side owns one of
+    them and neither needs a lock: the writer never overtakes what the reader
+    has freed, and the reader never passes what the writer has published.
+    """
+    def __init__(self, capacity=RING_CAPACITY):
+        self.capacity = capacity
+        self.shm = SharedMemory(create=True, size=RING_HEADER.size + capacity)
+        RING_HEADER.pack_into(self.shm.buf, 0, 0, 0)
+
+    def _copy_in(self, position, data):
+        buf, start = self.shm.buf, position % self.capacity
+        first = min(len(data), self.capacity - start)
+        buf[RING_HEADER.size + start:RING_HEADER.size + start + first] = data[:first]
+        if first < len(data):
+            buf[RING_HEADER.size:RING_HEADER.size + len(data) - first] = data[first:]
+
+    def _copy_out(self, position, size):
+        buf, start = self.shm.buf, position % self.capacity
+        first = min(size, self.capacity - start)
+        data = bytes(buf[RING_HEADER.size + start:RING_HEADER.size + start + first])
+        if first < size:
+            data += bytes(buf[RING_HEADER.size:RING_HEADER.size + size - first])
+        return data
+
+    def write(self, data):
+        """Appends one record. Returns False, writing nothing, if the ring lacks the space."""
+        written, read = RING_HEADER.unpack_from(self.shm.buf, 0)
+        needed = RECORD_HEADER.size + len(data)
+        if needed > self.capacity - (written - read):
+            return False
+        self._copy_in(written, RECORD_HEADER.pack(len(data)))
+        with memoryview(data) as view:
+            self._copy_in(written + RECORD_HEADER.size, view)
+        # Publish the record only once all of it is in place
+        struct.pack_into('Q', self.shm.buf, 0, written + needed)
+        return True
+
+    def read_all(self):
+        """Returns every record published since the last call, oldest first."""
+        written, read = RING_HEADER.unpack_from(self.shm.buf, 0)
+        records = []
+        while read < written:
+            size, = RECORD_HEADER.unpack(self._copy_out(read, RECORD_HEADER.size))
+            records.append(self._copy_out(read + RECORD_HEADER.size, size))
+            read += RECORD_HEADER.size + size
+        struct.pack_into('Q', self.shm.buf, 8, read)
+        return records
+
+    def close(self, unlink=False):
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+class Outbox:
+    """Packets bound for one other shard during the current window, already encoded as the ring's batch."""
+    __slots__ = ('buffer', 'earliest')
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.earliest = float('inf')
+
+    def append(self, when, target, packet):
+        self.buffer += TRANSIT_HEADER.pack(when, target, len(packet))
+        self.buffer += packet
+        if when < self.earliest:
+            self.earliest = when
+
+    def clear(self):
+        self.buffer.clear()
+        self.earliest = float('inf')
+
+def read_batch(batch):
+    """Yields (arrival time, target router index, packet) from an encoded batch."""
+    view = memoryview(batch)
+    offset = 0
+    while offset < len(view):
+        when, target, length = TRANSIT_HEADER.unpack_from(view, offset)
+        offset += TRANSIT_HEADER.size
+        # Unicast packets get their own mutable buffer, as routers forward them in place
+        packet = view[offset:offset + length]
+        yield when, target, bytearray(packet) if packet[0] in UNICAST else bytes(packet)
+        offset += length
+
+class RemoteLink(VirtualLink):
+    """A link to a router in another shard: it queues like any link, but delivery goes into an outbox."""
+    def __init__(self, scheduler, target, target_index, outbox, **link_options):
+        super().__init__(scheduler, target, **link_options)
+        self.target_index = target_index
+        self.outbox = outbox
+
+    def _transmit(self, latency, packet):
+        self.outbox.append(self.scheduler.now + latency, self.target_index, packet)
+
+class ShardEngine(VirtualSimulationEngine):
+    """The part of a sharded simulation that runs inside one worker process.
+
+    It simulates only the routers assigned to its shard. Packets for routers
+    elsewhere are encoded as they are sent into one outbox per shard, which is
+    written as a single record per time window into that shard's
+    shared-memory ring, so hellos, LSAs and data crossing the same shard
+    boundary travel together.
+    """
+    def __init__(self, graph, shard, assignment, seed, inbound, outbound):
+        super().__init__(graph, seed=seed)
+        self.shard = shard
+        self.assignment = assignment
+        self.inbound = inbound   # source shard -> ShmRing
+        self.outbound = outbound # target shard -> ShmRing
+        self.outboxes = {target: Outbox() for target in outbound}
+        # Routers are numbered the same way in every shard
+        self.router_names = sorted(graph.nodes())
+        self.router_indexes = {name: index for index, name in enumerate(self.router_names)}
+
+    def _new_link(self, neighbor, **link_options):
+        shard = self.assignment[neighbor]
+        if shard == self.shard:
+            return super()._new_link(neighbor, **link_options)
+        return RemoteLink(self.scheduler, neighbor, self.router_indexes[neighbor], self.outboxes[shard], **link_options)
+
+    def setup(self):
+        for node_id, node_data in self.graph.nodes(data=True):
+            if self.assignment[node_id] != self.shard:
+                continue
+            outgoing_links = {}
+            for neighbor in self.graph.neighbors(node_id):
+                outgoing_links[neighbor] = self.links[node_id, neighbor] = self._make_link(node_id, neighbor)
+            config = self._router_config(node_id, node_data)
+            self.devices[node_id] = VirtualRouter(node_id, config, self.scheduler, outgoing_links, sink=self._flow_delivered)
+
+    def shard_start(self):
+        self.setup()
+        for device in self.devices.values():
+            device.start()
+
+    def shard_run(self, until, overflow):
+        """Runs one time window: takes in what other shards sent, runs up to until and flushes the outboxes.
+
+        Returns (earliest time anything is pending here or in what was sent,
+        {target shard: batch} for batches that did not fit in their ring).
+        """
+        batches = []
+        for source in sorted(self.inbound):
+            batches.extend(self.inbound[source].read_all())
+        batches.extend(overflow)
+        names = self.router_names
+        for batch in batches:
+            for when, target, packet in read_batch(batch):
+                self.scheduler.schedule_at(when, 'deliver', names[target], packet)
+
+        self.scheduler.run_until(until, self._dispatch, inclusive=False)
+
+        earliest = self.scheduler.next_time()
+        spilled = {}
+        for target, outbox in self.outboxes.items():
+            if not outbox.buffer:
+                continue
+            earliest = min(earliest, outbox.earliest)
+            if not self.outbound[target].write(outbox.buffer):
+                spilled[target] = bytes(outbox.buffer)
+            outbox.clear()
+        return earliest, spilled
+
+    def shard_inject(self, device_id, packet):
+        self._inject(device_id, packet)
+
+    def shard_cut_link(self, d1, d2):
+        self._cut_link(d1, d2)
+
+    def shard_counters(self):
+        return self._router_counters()
+
+    def shard_routes(self, device_id):
+        self.show_routes(device_id)
+
+    def shard_reset(self):
+        self._reset_measurements()
+
+    def shard_add_flow(self, flow):
+        self._add_flow(flow)
+
+    def shard_stop_traffic(self):
+        for flow in self.flows.values():
+            flow.active = False
+
+    def shard_flows(self):
+        return self.flows
+
+    def shard_links(self):
+        return self.link_samples()
+
+def _shard_main(conn, graph, shard, assignment, seed, inbound, outbound):
+    """Worker process loop: runs the commands the coordinator sends and returns what they printed."""
+    engine = ShardEngine(graph, shard, assignment, seed, inbound, outbound)
+    while True:
+        command, args = conn.recv()
+        if command == 'exit':
+            break
+        output = io.StringIO()
+        result, error = None, None
+        try:
+            with contextlib.redirect_stdout(output):
+                result = getattr(engine, 'shard_' + command)(*args)
+        except Exception:
+            error = traceback.format_exc()
+        conn.send((result, output.getvalue(), error))
+    for ring in list(inbound.values()) + list(outbound.values()):
+        ring.close()
+
+class ShardedSimulationEngine(VirtualSimulationEngine):
+    """Runs the virtual engine's network across several worker processes.
+
+    The graph is cut into balanced shards with few links between them, one
+    process each. Shards advance in lockstep windows no longer than the link
+    delay: a packet sent across shards during a window cannot arrive before
+    the window ends, so every shard can run its window in parallel and only
+    exchange packets at the barrier. Windows with nothing to do are skipped.
+
+    Unlike the single-process engine, an advance leaves events due exactly at
+    its end time for the next advance.
+    """
+    def __init__(self, graph, shards=None, seed=0):
+        super().__init__(graph, seed=seed)
+        self.shards = max(1, min(shards or os.cpu_count() or 1, graph.number_of_nodes()))
+        self.assignment = partition_graph(graph, self.shards, seed)
+        self.lookahead = LINK_DELAY
+        self._workers = []
+        self._rings = []
+        self._pending = float('inf') # Earliest event anywhere, as of the last window
+        self._overflow = [[] for _ in range(self.shards)]
+
+    def setup(self):
+        rings = {(a, b): ShmRing() for a in range(self.shards) for b in range(self.shards) if a != b}
+        self._rings = list(rings.values())
+        # Forked workers inherit the graph and the rings instead of unpickling them
+        context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+        for shard in range(self.shards):
+            inbound = {a: ring for (a, b), ring in rings.items() if b == shard}
+            outbound = {b: ring for (a, b), ring in rings.items() if a == shard}
+            parent, child = context.Pipe()
+            process = context.Process(
+                target=_shard_main, args=(child, self.graph, shard, self.assignment, self.seed + shard, inbound, outbound),
+                daemon=True)
+            process.start()
+            self._workers.append((process, parent))
+
+    def _call(self, command, *args, shards=None, per_shard_args=None):
+        """Sends a command to the given shards (default all) and returns their results in shard order.
+
+        Everything the shards printed is echoed in shard order, so output is
+        deterministic even though the shards ran concurrently.
+        """
+        shards = range(self.shards) if shards is None else shards
+        for shard in shards:
+            self._workers[shard][1].send((command, per_shard_args[shard] if per_shard_args else args))
+        # Collect every reply before raising so no shard is left with one unread
+        replies = [self._workers[shard][1].recv() for shard in shards]
+        results = []
+        for shard, (result, output, error) in zip(shards, replies):
+            if output:
+                print(output, end='')
+            if error:
+                raise RuntimeError(f"Shard {shard} failed running {command}:\n{error}")
+            results.append(result)
+        return results
+
+    # Routers live in the worker processes, so there is no state here to snapshot; the command log can
+    # still be recorded and replayed
+    def save_snapshot(self, path):
+        raise SnapshotError(SNAPSHOT_UNSUPPORTED)
+
+    def load_snapshot(self, path):
+        raise SnapshotError(SNAPSHOT_UNSUPPORTED)
+
+    def _owner(self, device_id):
+        return [self.assignment[device_id]]
+
+    def start(self):
+        self.setup()
+        log.info("--- Sharded %d routers into %d processes, %d links cross shards ---",
+                 self.graph.number_of_nodes(), self.shards, cut_size(self.graph, self.assignment))
+        self._call('start')
+        self._pending = 0.0
+        log.info("--- Network settling for %s virtual seconds... ---", SETTLE_TIME)
+        self.advance(SETTLE_TIME)
+
+    def _run_window(self, until):
+        args = [(until, self._overflow[shard]) for shard in range(self.shards)]
+        self._overflow = [[] for _ in range(self.shards)]
+        results = self._call('run', per_shard_args=args)
+        self._pending = min(earliest for earliest, _ in results)
+        for _, spilled in results:
+            for target, batch in spilled.items():
+                self._overflow[target].append(batch)
+        self.scheduler.now = until
+
+    def advance(self, seconds):
+        """Runs every shard for the given number of virtual seconds, window by window."""
+        started = time.perf_counter()
+        end = self.scheduler.now + seconds
+        windows = 0
+        while True:
+            # Jump straight to the next window with something in it
+            start = max(self.scheduler.now, self._pending)
+            if start >= end:
+                break
+            self._run_window(min(start + self.lookahead, end))
+            windows += 1
+        # Leave every shard's clock at the end so commands between advances see the same time
+        self._run_window(end)
+        elapsed = time.perf_counter() - started
+        METRICS.add_time('simulate.advance', elapsed)
+        METRICS.count('sim_windows', windows)
+        log.info("--- Advanced %ss to t=%.3fs (%d windows across %d shards in %.1f ms) ---", seconds,
+                 self.scheduler.now, windows, self.shards, elapsed * 1000)
+
+    def _inject(self, device_id, packet):
+        self._call('inject', device_id, packet, shards=self._owner(device_id))
+        self._pending = self.scheduler.now
+
+    def _cut_link(self, d1, d2):
+        if d1 in self.graph and d2 in self.graph:
+            self._call('cut_link', d1, d2, shards=sorted({self.assignment[d1], self.assignment[d2]}))
+
+    def _router_counters(self):
+        counters, route_changes = {}, []
+        for shard_counters, shard_changes in self._call('counters'):
+            counters.update(shard_counters)
+            route_changes.extend(shard_changes)
+        return counters, route_changes
+
+    def show_routes(self, device_id):
+        if device_id not in self.graph:
+            print(f"Error: Device {device_id} not found.")
+            return
+        self._call('routes', device_id, shards=self._owner(device_id))
+
+    def _reset_measurements(self):
+        self.flows = {}
+        self.measured_since = self.scheduler.now
+        self._call('reset')
+
+    def _add_flow(self, flow):
+        # Every shard knows every flow; only the source's shard sends, the destination's counts deliveries
+        self.flows[flow.flow_id] = flow
+        self._call('add_flow', flow)
+        self._pending = self.scheduler.now
+
+    def stop_traffic(self):
+        self._call('stop_traffic')
+        for flow in self.flows.values():
+            flow.active = False
+        log.info("--- Traffic stopped ---")
+
+    def flow_counters(self):
+        merged = {}
+        for flows in self._call('flows'):
+            for flow_id, flow in flows.items():
+                if flow_id in merged:
+                    merged[flow_id].merge(flow)
+                else:
+                    merged[flow_id] = flow
+        return [merged[flow_id] for flow_id in sorted(merged)]
+
+    def link_samples(self):
+        samples = {}
+        for shard_samples in self._call('links'):
+            samples.update(shard_samples)
+        return samples
+
+    def _shutdown(self):
+        for process, conn in self._workers:
+            conn.send(('exit', ()))
+        for process, conn in self._workers:
+            process.join()
+        for ring in self._rings:
+            ring.close(unlink=True)
+        self._workers, self._rings = [], []
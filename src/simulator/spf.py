@@ -0,0 +1,143 @@
+import heapq
+
+INFINITY = float('inf')
+
+class ShortestPathTree:
+    """A router's shortest-path tree over the link-state database.
+
+    The tree is built once with Dijkstra and then patched as individual links
+    change: a worse or removed tree link only re-solves the subtree hanging off
+    it, and a better or new link only relaxes outward from where it improves
+    things. Every other branch of the tree is left untouched.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.adjacency = {root: {}}  # u -> {v: cost} for links usable in both directions
+        self.dist = {root: 0}
+        self.parent = {root: None}
+        self.children = {root: set()}
+        self.first_hop = {root: None}
+        self.full_runs = 0
+        self.incremental_runs = 0
+
+    def rebuild(self):
+        """Recomputes the whole tree from scratch. Returns the set of nodes now in it."""
+        self.full_runs += 1
+        self.dist = {self.root: 0}
+        self.parent = {self.root: None}
+        self.children = {self.root: set()}
+        self.first_hop = {}
+        self._relax_from([(0, self.root)])
+        self._update_first_hops(self.dist.keys())
+        return set(self.dist)
+
+    def apply_changes(self, changes):
+        """Applies directed (u, v, cost) link changes, cost None meaning removed, and patches the tree.
+
+        Callers only pass links that both ends advertise, so every link in the
+        adjacency is usable.
+
+        Returns the set of nodes whose distance, parent or reachability changed.
+        """
+        worse, better = [], []
+        for u, v, cost in changes:
+            old = self.adjacency.get(u, {}).get(v)
+            if cost is None:
+                self.adjacency.get(u, {}).pop(v, None)
+            else:
+                self.adjacency.setdefault(u, {})[v] = cost
+                self.adjacency.setdefault(v, {})
+            if old is not None and (cost is None or cost > old):
+                worse.append((u, v))
+            elif cost is not None and (old is None or cost < old):
+                better.append((u, v, cost))
+        if not worse and not better:
+            return set()
+
+        self.incremental_runs += 1
+        affected = set()
+
+        # A worse link only matters if the tree uses it: detach the subtree below it
+        # and re-attach each detached node through its best remaining neighbor
+        detached = set()
+        for u, v in worse:
+            if self.parent.get(v) == u and v not in detached:
+                detached |= self._detach_subtree(v)
+        if detached:
+            affected |= detached
+            seeds = []
+            for x in detached:
+                best, via = INFINITY, None
+                for w in self.adjacency.get(x, {}):
+                    cost = self.adjacency.get(w, {}).get(x)
+                    if cost is not None and w in self.dist and self.dist[w] + cost < best:
+                        best, via = self.dist[w] + cost, w
+                if via is not None:
+                    self._set_parent(x, via, best)
+                    seeds.append((best, x))
+            affected |= self._relax_from(seeds)
+
+        # A better link only matters if it shortens the path to its far end
+        seeds = []
+        for u, v, cost in better:
+            if u in self.dist and self.dist[u] + cost < self.dist.get(v, INFINITY):
+                self._set_parent(v, u, self.dist[u] + cost)
+                seeds.append((self.dist[v], v))
+                affected.add(v)
+        affected |= self._relax_from(seeds)
+
+        for x in affected:
+            if x not in self.dist:
+                self.first_hop.pop(x, None)
+        self._update_first_hops(x for x in affected if x in self.dist)
+        return affected
+
+    def _detach_subtree(self, top):
+        """Removes top and all of its descendants from the tree and returns them."""
+        detached = set()
+        stack = [top]
+        while stack:
+            x = stack.pop()
+            detached.add(x)
+            stack.extend(self.children.pop(x, ()))
+            parent = self.parent.pop(x, None)
+            if parent is not None and parent in self.children:
+                self.children[parent].discard(x)
+            del self.dist[x]
+        return detached
+
+    def _set_parent(self, x, parent, dist):
+        old_parent = self.parent.get(x)
+        if old_parent is not None and old_parent in self.children:
+            self.children[old_parent].discard(x)
+        self.parent[x] = parent
+        self.dist[x] = dist
+        self.children.setdefault(parent, set()).add(x)
+        self.children.setdefault(x, set())
+
+    def _relax_from(self, seeds):
+        """Runs Dijkstra outward from already-placed (dist, node) seeds. Returns the nodes it improved."""
+        improved = set()
+        heap = list(seeds)
+        heapq.heapify(heap)
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > self.dist.get(u, INFINITY):
+                continue
+            for v, cost in self.adjacency.get(u, {}).items():
+                if d + cost < self.dist.get(v, INFINITY):
+                    self._set_parent(v, u, d + cost)
+                    improved.add(v)
+                    heapq.heappush(heap, (d + cost, v))
+        return improved
+
+    def _update_first_hops(self, nodes):
+        # Parents are always closer to the root, so process in order of distance
+        for x in sorted(nodes, key=self.dist.__getitem__):
+            parent = self.parent[x]
+            if parent is None:
+                self.first_hop[x] = None
+            elif parent == self.root:
+                self.first_hop[x] = x
+            else:
+                self.first_hop[x] = self.first_hop[parent]
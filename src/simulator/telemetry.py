@@ -0,0 +1,108 @@
+from collections import namedtuple
+
+HISTOGRAM_BUCKETS = 160 # Covers up to 2**41 microseconds, about 25 days
+REPORT_TOP_LINKS = 20
+
+# A link direction's counters since the measurement window started
+LinkSample = namedtuple('LinkSample', ['utilization', 'packets', 'bytes', 'queue_drops', 'mtu_drops', 'queue_peak',
+                                       'latency'])
+
+def _bucket(microseconds):
+    """Returns the log-linear bucket of a latency: four buckets per power of two."""
+    if microseconds < 4:
+        return microseconds
+    exponent = microseconds.bit_length()
+    return (exponent - 2) * 4 + ((microseconds >> (exponent - 3)) & 3)
+
+def _bucket_limit(bucket):
+    """Returns the exclusive upper bound in microseconds of a bucket."""
+    if bucket < 4:
+        return bucket + 1
+    group, step = divmod(bucket, 4)
+    return (5 + step) << (group - 1)
+
+class LatencyHistogram:
+    """Latencies counted in log-linear buckets of microseconds.
+
+    Recording is a bit_length, a shift and an increment, so it can sit on
+    every packet of a flow; percentiles are accurate to within 25%.
+    """
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[min(_bucket(int(seconds * 1e6)), HISTOGRAM_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def merge(self, other):
+        """Adds another histogram's samples to this one."""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        """Returns the upper bound in seconds of the bucket holding the p-th percentile."""
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(_bucket_limit(bucket) / 1e6, self.max)
+        return self.max
+
+class Flow:
+    """A constant-rate stream of DATA packets from one router to one address."""
+    __slots__ = ('flow_id', 'source', 'destination', 'src_ip', 'dst_ip', 'rate', 'size', 'active',
+                 'sent', 'delivered', 'latency')
+
+    def __init__(self, flow_id, source, destination, src_ip, dst_ip, rate, size):
+        self.flow_id = flow_id
+        self.source = source
+        self.destination = destination # What the user asked for: a router name or an address
+        self.src_ip = src_ip
+        self.dst_ip = dst_ip
+        self.rate = rate  # Packets per second
+        self.size = size  # Bytes per packet
+        self.active = True
+        self.sent = 0
+        self.delivered = 0
+        self.latency = LatencyHistogram()
+
+    def merge(self, other):
+        """Adds the counters another copy of the same flow collected elsewhere, e.g. on another shard."""
+        self.sent += other.sent
+        self.delivered += other.delivered
+        self.latency.merge(other.latency)
+
+def print_flow_report(flows):
+    """Prints each flow's delivery ratio and end-to-end latency."""
+    print(f"{'Flow':>5}  {'Source':<10}{'Destination':<16}{'pps':>9}{'Sent':>10}{'Delivered':>11}"
+          f"{'Lost':>8}{'p50 ms':>9}{'p99 ms':>9}")
+    for flow in flows:
+        print(f"{flow.flow_id:>5}  {flow.source:<10}{flow.destination:<16}{flow.rate:>9g}{flow.sent:>10}"
+              f"{flow.delivered:>11}{flow.sent - flow.delivered:>8}"
+              f"{flow.latency.percentile(50) * 1000:>9.3f}{flow.latency.percentile(99) * 1000:>9.3f}")
+    print("Lost includes packets still in flight.")
+
+def print_link_report(samples, elapsed):
+    """Prints the busiest of {(device, neighbor): LinkSample} over a window of elapsed seconds."""
+    busiest = sorted(samples.items(), key=lambda item: item[1].utilization, reverse=True)[:REPORT_TOP_LINKS]
+    print(f"{'Link':<24}{'Util':>7}{'Mbps':>10}{'Packets':>10}{'Q drops':>9}{'MTU drops':>11}{'p50 ms':>9}{'p99 ms':>9}")
+    for (u, v), sample in busiest:
+        print(f"{u + '->' + v:<24}{sample.utilization:>7.1%}{sample.bytes * 8 / elapsed / 1e6:>10.2f}"
+              f"{sample.packets:>10}{sample.queue_drops:>9}{sample.mtu_drops:>11}"
+              f"{sample.latency.percentile(50) * 1000:>9.3f}{sample.latency.percentile(99) * 1000:>9.3f}")
@@ -0,0 +1,498 @@
+import heapq
+import logging
+import random
+import time
+from collections import deque
+from ..analyzer import link_capacity
+from ..instrument import METRICS
+from .device import RouterCore, HELLO_INTERVAL, NEIGHBOR_TIMEOUT, DEFAULT_TTL
+from .engine import SimulationEngine, HELP_TEXT
+from .packet import DATA, SIZE, FLOW, SENT_AT, new_packet
+from .snapshot import SnapshotError, save_snapshot, load_snapshot
+from .telemetry import Flow, LatencyHistogram, LinkSample, print_flow_report, print_link_report
+
+LINK_DELAY = 0.001  # Virtual seconds a packet spends on a link
+SETTLE_TIME = 2     # Virtual seconds run before handing control to the user
+PING_TIME = 1       # Virtual seconds run after a ping so its reply can arrive
+
+DEFAULT_BANDWIDTH = 100000 # kbps, for links without a configured bandwidth
+DEFAULT_MTU = 1500         # bytes, for links without a configured MTU
+QUEUE_LIMIT = 64           # DATA packets a link buffers before it starts dropping
+CONTROL_PACKET_SIZE = 64   # bytes on the wire of a HELLO, LSA or ping
+DATA_PACKET_SIZE = 1000    # bytes, default size of generated traffic
+
+log = logging.getLogger(__name__)
+
+TRAFFIC_USAGE = "Usage: traffic <src> <dst> <pps> [bytes] | traffic random <flows> <pps> [bytes] | traffic stop"
+VIRTUAL_HELP = (HELP_TEXT.replace("pause, resume", "advance <seconds>, traffic ..., flows, links, "
+                                  "save <file>, load <file>, record <file>, replay <file>")
+                + "\n" + TRAFFIC_USAGE)
+
+# Commands that manage the session rather than the network, so they are not part of its command log
+SESSION_COMMANDS = ('save', 'load', 'record', 'replay', 'help', 'exit')
+
+class EventScheduler:
+    """A virtual clock driven by a priority queue of pending events.
+
+    Events are plain (time, seq, kind, target, payload) tuples rather than
+    callbacks; seq breaks ties so runs with the same seed replay identically.
+    """
+    def __init__(self, seed=0):
+        self.now = 0.0
+        self.random = random.Random(seed)
+        self.events_processed = 0
+        self._queue = []
+        self._seq = 0
+
+    def time(self):
+        return self.now
+
+    def schedule(self, delay, kind, target, payload=None):
+        self._seq += 1
+        heapq.heappush(self._queue, (self.now + delay, self._seq, kind, target, payload))
+
+    def schedule_at(self, when, kind, target, payload=None):
+        self._seq += 1
+        heapq.heappush(self._queue, (when, self._seq, kind, target, payload))
+
+    def next_time(self):
+        """Returns the time of the earliest pending event, or infinity if there is none."""
+        return self._queue[0][0] if self._queue else float('inf')
+
+    def run_until(self, end_time, dispatch, inclusive=True):
+        """Pops and dispatches every event due up to end_time, then moves the clock there.
+
+        With inclusive=False, events at exactly end_time are left for later.
+        """
+        queue = self._queue
+        while queue and (queue[0][0] <= end_time if inclusive else queue[0][0] < end_time):
+            event_time, _, kind, target, payload = heapq.heappop(queue)
+            self.now = event_time
+            dispatch(kind, target, payload)
+            self.events_processed += 1
+        self.now = max(self.now, end_time)
+
+class VirtualLink:
+    """One direction of a link with a bandwidth, an MTU, a propagation delay and a bounded FIFO.
+
+    Putting a packet on it works out when the packet finishes serializing
+    behind the ones already queued and schedules its delivery for then plus the
+    propagation delay, so queueing needs no events of its own. DATA packets
+    beyond the queue limit are tail-dropped; routing protocol packets are
+    never dropped for lack of buffer space, as if they had priority.
+    """
+    def __init__(self, scheduler, target, delay=LINK_DELAY, bandwidth=DEFAULT_BANDWIDTH, mtu=DEFAULT_MTU,
+                 queue_limit=QUEUE_LIMIT):
+        self.scheduler = scheduler
+        self.target = target
+        self.delay = delay
+        self.bits_per_second = bandwidth * 1000
+        self.mtu = mtu
+        self.queue_limit = queue_limit
+        self.busy_until = 0.0
+        self._departures = deque() # When each packet still queued finishes serializing
+        self.reset_counters()
+
+    def utilization(self, since):
+        """Returns the share of time since the given instant the link spent transmitting."""
+        now = self.scheduler.now
+        if now <= since:
+            return 0.0
+        # Packets still waiting in the queue haven't used their transmit time yet
+        return (self.busy_time - max(0.0, self.busy_until - now)) / (now - since)
+
+    def reset_counters(self):
+        self.packets = 0
+        self.bytes = 0
+        self.queue_drops = 0
+        self.mtu_drops = 0
+        self.queue_peak = 0 # Most packets queued at once
+        self.busy_time = 0.0
+        self.latency = LatencyHistogram()
+
+    def put(self, packet):
+        # Control packets leave the size field at 0
+        size = SIZE.unpack_from(packet)[0] or CONTROL_PACKET_SIZE
+        if size > self.mtu:
+            self.mtu_drops += 1
+            return
+        now = self.scheduler.now
+        departures = self._departures
+        while departures and departures[0] <= now:
+            departures.popleft()
+        if len(departures) >= self.queue_limit and packet[0] == DATA:
+            self.queue_drops += 1
+            return
+
+        transmit = size * 8 / self.bits_per_second
+        self.busy_until = max(now, self.busy_until) + transmit
+        departures.append(self.busy_until)
+        if len(departures) > self.queue_peak:
+            self.queue_peak = len(departures)
+        self.packets += 1
+        self.bytes += size
+        self.busy_time += transmit
+        latency = self.busy_until + self.delay - now
+        self.latency.record(latency)
+        self._transmit(latency, packet)
+
+    def _transmit(self, latency, packet):
+        """Hands the packet to the far end, latency seconds from now."""
+        self.scheduler.schedule(latency, 'deliver', self.target, packet)
+
+    def sample(self, since):
+        return LinkSample(self.utilization(since), self.packets, self.bytes, self.queue_drops, self.mtu_drops,
+                          self.queue_peak, self.latency)
+
+class VirtualRouter(RouterCore):
+    """A router whose timers and clock live on the engine's EventScheduler."""
+    def __init__(self, device_id, config, scheduler, outgoing_links, sink=None):
+        super().__init__(device_id, config, outgoing_links, clock=scheduler.time)
+        self.scheduler = scheduler
+        self.sink = sink
+
+    def _deliver(self, packet):
+        if self.sink is not None:
+            self.sink(packet)
+
+    def start(self):
+        log.info("[%s] Booting up...", self.device_id)
+        # Jitter the first HELLO so routers don't all fire at the same instant
+        self.scheduler.schedule(self.scheduler.random.uniform(0, HELLO_INTERVAL / 10), 'hello', self.device_id)
+        self.scheduler.schedule(NEIGHBOR_TIMEOUT / 2, 'liveness', self.device_id)
+
+    def on_hello_timer(self):
+        self._send_hello_packets()
+        self.scheduler.schedule(HELLO_INTERVAL, 'hello', self.device_id)
+
+    def on_liveness_timer(self):
+        self._check_neighbor_liveness()
+        self.scheduler.schedule(NEIGHBOR_TIMEOUT / 2, 'liveness', self.device_id)
+
+    def __getstate__(self):
+        # The sink is a method of the engine, which is rebound after a restore rather than pickled with every router
+        return dict(self.__dict__, sink=None)
+
+class VirtualSimulationEngine(SimulationEngine):
+    """A deterministic discrete-event engine running on a virtual clock.
+
+    Nothing happens between commands: time only moves forward on 'advance'
+    (and briefly after a ping), so hours of protocol time take milliseconds and
+    a given seed always produces the same run.
+
+    That makes the whole run reproducible from its seed and the commands it
+    was given, which the engine logs, and lets its state be snapshotted to a
+    file and restored later to continue exactly where it left off.
+    """
+    def __init__(self, graph, seed=0):
+        self.seed = seed
+        self.scheduler = EventScheduler(seed)
+        self.command_log = [] # Every network command since boot, as typed; comments mark snapshots
+        self.links = {}  # (device, neighbor) -> VirtualLink
+        self.flows = {}
+        self._next_flow_id = 0
+        self.measured_since = 0.0
+        super().__init__(graph)
+
+    def _make_queue(self):
+        # Packets go straight onto the scheduler; there are no queues to poll
+        return None
+
+    def _make_link(self, node_id, neighbor):
+        """Builds one direction of a link from the edge's parsed bandwidth and MTU."""
+        if self.graph.is_multigraph():
+            edges = self.graph[node_id][neighbor].values()
+        else:
+            edges = self.graph[node_id][neighbor].get('links', [self.graph[node_id][neighbor]])
+        # Parallel links are modeled as one link with their combined bandwidth
+        mtus = [edge['mtu'] for edge in edges if edge.get('mtu')]
+        return self._new_link(neighbor, bandwidth=link_capacity(self.graph, node_id, neighbor) or DEFAULT_BANDWIDTH,
+                              mtu=min(mtus) if mtus else DEFAULT_MTU)
+
+    def _new_link(self, neighbor, **link_options):
+        return VirtualLink(self.scheduler, neighbor, **link_options)
+
+    def setup(self):
+        for node_id, node_data in self.graph.nodes(data=True):
+            outgoing_links = {}
+            for neighbor in self.graph.neighbors(node_id):
+                outgoing_links[neighbor] = self.links[node_id, neighbor] = self._make_link(node_id, neighbor)
+            config = self._router_config(node_id, node_data)
+            self.devices[node_id] = VirtualRouter(node_id, config, self.scheduler, outgoing_links, sink=self._flow_delivered)
+
+    def _now(self):
+        return self.scheduler.now
+
+    def _inject(self, device_id, packet):
+        self.scheduler.schedule(0, 'deliver', device_id, packet)
+
+    def _dispatch(self, kind, target, payload):
+        if kind == 'flow':
+            self._send_flow_packet(target)
+            return
+        device = self.devices[target]
+        if kind == 'deliver':
+            device._process_packet(payload)
+        elif kind == 'hello':
+            device.on_hello_timer()
+        elif kind == 'liveness':
+            device.on_liveness_timer()
+
+    def advance(self, seconds):
+        """Runs the network for the given number of virtual seconds."""
+        started = time.perf_counter()
+        processed = self.scheduler.events_processed
+        self.scheduler.run_until(self.scheduler.now + seconds, self._dispatch)
+        elapsed = time.perf_counter() - started
+        METRICS.add_time('simulate.advance', elapsed)
+        METRICS.count('sim_events', self.scheduler.events_processed - processed)
+        log.info("--- Advanced %ss to t=%.3fs (%d events in %.1f ms) ---", seconds, self.scheduler.now,
+                 self.scheduler.events_processed - processed, elapsed * 1000)
+
+    def start(self):
+        if self.devices:
+            log.info("--- Resuming from snapshot at t=%.3fs ---", self.scheduler.now)
+            return
+        self.setup()
+        for device in self.devices.values():
+            device.start()
+        log.info("--- Network settling for %s virtual seconds... ---", SETTLE_TIME)
+        self.advance(SETTLE_TIME)
+
+    def run(self):
+        self.start()
+        log.info("\n--- Simulation Running (virtual time). Type 'help' for commands. ---")
+        try:
+            while self.execute(input("> ")):
+                pass
+        finally:
+            self.stop()
+
+    def run_script(self, lines):
+        """Runs commands non-interactively, e.g. a failure scenario in CI."""
+        self.start()
+        try:
+            self._run_lines(lines)
+        finally:
+            self.stop()
+
+    def _run_lines(self, lines):
+        """Executes each line that isn't a comment, echoing it. Returns False if one of them was exit."""
+        for line in lines:
+            if line.strip().startswith('#'):
+                continue
+            print(f"> {line.strip()}")
+            if not self.execute(line):
+                return False
+        return True
+
+    def execute(self, line):
+        cmd = line.strip().lower().split()
+        if cmd and cmd[0] not in SESSION_COMMANDS:
+            self.command_log.append(line.strip())
+        if cmd and cmd[0] in ('save', 'load', 'record', 'replay'):
+            if len(cmd) != 2:
+                print(f"Usage: {cmd[0]} <file>")
+                return True
+            # File names keep their case
+            return self._session_command(cmd[0], line.split()[1])
+        if cmd and cmd[0] == 'advance' and len(cmd) == 2:
+            try:
+                seconds = float(cmd[1])
+            except ValueError:
+                print("Unknown command.")
+                return True
+            self.advance(seconds)
+            return True
+        if cmd and cmd[0] == 'traffic':
+            self._traffic_command(cmd[1:])
+            return True
+        if cmd == ['flows']:
+            self.show_flows()
+            return True
+        if cmd == ['links']:
+            self.show_links()
+            return True
+        if cmd and cmd[0] == 'help':
+            print(VIRTUAL_HELP)
+            return True
+        return super().execute(line)
+
+    def _session_command(self, command, path):
+        try:
+            if command == 'save':
+                self.save_snapshot(path)
+            elif command == 'load':
+                self.load_snapshot(path)
+            elif command == 'record':
+                self.write_command_log(path)
+            else:
+                with open(path) as f:
+                    return self._run_lines(f.read().splitlines())
+        except (SnapshotError, OSError) as e:
+            print(f"Error: {e}")
+        return True
+
+    def save_snapshot(self, path):
+        """Writes the whole simulation, topology and pending events included, to a file load_snapshot can resume."""
+        self.command_log.append(f"# snapshot {path} saved at t={self.scheduler.now:.3f}s")
+        size = save_snapshot(path, type(self).__name__, dict(self.__dict__))
+        log.info("--- Saved snapshot at t=%.3fs to %s (%d KiB) ---", self.scheduler.now, path, size // 1024)
+
+    def load_snapshot(self, path):
+        """Replaces the running simulation with the one saved in a snapshot."""
+        self._restore(load_snapshot(path, type(self).__name__))
+        self.command_log.append(f"# snapshot {path} restored")
+        log.info("--- Restored snapshot %s at t=%.3fs ---", path, self.scheduler.now)
+
+    @classmethod
+    def from_snapshot(cls, path):
+        """Returns an engine resuming the simulation saved in a snapshot; its topology comes from the snapshot too."""
+        engine = cls.__new__(cls)
+        engine.load_snapshot(path)
+        return engine
+
+    def _restore(self, state):
+        self.__dict__.update(state)
+        for device in self.devices.values():
+            device.sink = self._flow_delivered
+
+    def write_command_log(self, path):
+        """Writes every command since boot as a script that --script or replay runs again, to the same state."""
+        with open(path, 'w') as f:
+            f.write(f"# Command log to t={self.scheduler.now:.3f}s; replay with --seed {self.seed} --script {path}\n")
+            f.writelines(f"{line}\n" for line in self.command_log)
+        log.info("--- Recorded %d commands to %s ---", sum(not line.startswith('#') for line in self.command_log), path)
+
+    def _traffic_command(self, args):
+        if args == ['stop']:
+            self.stop_traffic()
+            return
+        try:
+            if len(args) in (3, 4) and args[0] == 'random':
+                self.start_random_flows(int(args[1]), float(args[2]), *map(int, args[3:]))
+            elif len(args) in (3, 4):
+                flow = self.start_flow(args[0].upper(), args[1].upper(), float(args[2]), *map(int, args[3:]))
+                if flow is not None:
+                    log.info("--- Started flow %d from %s to %s at %g pps ---", flow.flow_id, flow.source,
+                             flow.destination, flow.rate)
+            else:
+                print(TRAFFIC_USAGE)
+        except ValueError:
+            print(TRAFFIC_USAGE)
+
+    def _reset_measurements(self):
+        """Starts a new measurement window: clears flows and link counters."""
+        self.flows = {}
+        for link in self.links.values():
+            link.reset_counters()
+        self.measured_since = self.scheduler.now
+
+    def start_flow(self, source, dest, rate, size=DATA_PACKET_SIZE):
+        """Starts sending size-byte DATA packets at rate packets per second. Returns the flow, or None.
+
+        Starting traffic while none is running begins a new measurement window.
+        """
+        src_ip = self._first_address(source) if source in self.graph else None
+        if src_ip is None:
+            print(f"Error: Source device {source} not found or has no IP address.")
+            return None
+        dst_ip = self._resolve_address(dest)
+        if dst_ip is None:
+            print(f"Error: Destination {dest} is neither an IP address nor an addressed device.")
+            return None
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        if not any(flow.active for flow in self.flows.values()):
+            self._reset_measurements()
+        flow = Flow(self._next_flow_id, source, dest, src_ip, dst_ip, rate, size)
+        self._next_flow_id += 1
+        self._add_flow(flow)
+        return flow
+
+    def _add_flow(self, flow):
+        self.flows[flow.flow_id] = flow
+        if flow.source in self.devices:
+            # A random phase keeps flows started together from sending in lockstep
+            self.scheduler.schedule(self.scheduler.random.uniform(0, 1 / flow.rate), 'flow', flow.flow_id)
+
+    def start_random_flows(self, count, rate, size=DATA_PACKET_SIZE):
+        """Starts count flows between random pairs of routers."""
+        names = sorted(self.graph.nodes())
+        if len(names) < 2:
+            print("Error: Random flows need at least two routers.")
+            return
+        for _ in range(count):
+            source, dest = self.scheduler.random.sample(names, 2)
+            self.start_flow(source, dest, rate, size)
+        log.info("--- Started %d flows of %g pps ---", count, rate)
+
+    def stop_traffic(self):
+        for flow in self.flows.values():
+            flow.active = False
+        log.info("--- Traffic stopped ---")
+
+    def _send_flow_packet(self, flow_id):
+        flow = self.flows.get(flow_id)
+        if flow is None or not flow.active:
+            return
+        flow.sent += 1
+        self.devices[flow.source]._process_packet(new_packet(
+            DATA, flow.source, DEFAULT_TTL, flow.size, flow.src_ip, flow.dst_ip, flow_id, self.scheduler.now))
+        self.scheduler.schedule(1 / flow.rate, 'flow', flow_id)
+
+    def _flow_delivered(self, packet):
+        flow = self.flows.get(FLOW.unpack_from(packet)[0])
+        if flow is not None:
+            flow.delivered += 1
+            flow.latency.record(self.scheduler.now - SENT_AT.unpack_from(packet)[0])
+
+    def flow_counters(self):
+        """Returns every flow since traffic started, with its sent and delivered counters."""
+        return list(self.flows.values())
+
+    def show_flows(self):
+        print_flow_report(self.flow_counters())
+
+    def link_samples(self):
+        """Returns {(device, neighbor): LinkSample} for every link direction since traffic started."""
+        return {key: link.sample(self.measured_since) for key, link in self.links.items()}
+
+    def show_links(self):
+        """Prints the busiest link directions since traffic started, with drops and per-hop latency."""
+        elapsed = self.scheduler.now - self.measured_since
+        if elapsed <= 0:
+            print("No time has passed since traffic started.")
+            return
+        print_link_report(self.link_samples(), elapsed)
+
+    def _record_metrics(self):
+        super()._record_metrics()
+        for sample in self.link_samples().values():
+            METRICS.count('sim_link_packets', sample.packets)
+            METRICS.count('sim_link_bytes', sample.bytes)
+            METRICS.count('sim_queue_drops', sample.queue_drops)
+            METRICS.count('sim_mtu_drops', sample.mtu_drops)
+            METRICS.peak('sim_queue_peak', sample.queue_peak)
+        for flow in self.flow_counters():
+            METRICS.count('sim_flow_packets_sent', flow.sent)
+            METRICS.count('sim_flow_packets_delivered', flow.delivered)
+
+    def ping(self, source, dest):
+        super().ping(source, dest)
+        if source in self.graph:
+            self.advance(PING_TIME)
+
+    def pause(self):
+        log.info("--- Virtual time only advances on 'advance'; nothing to pause. ---")
+
+    def resume(self):
+        log.info("--- Virtual time only advances on 'advance'; nothing to resume. ---")
+
+    def stop(self):
+        self._record_metrics()
+        self._shutdown()
+        log.info("--- Simulation Stopped at t=%.3fs ---", self.scheduler.now)
+
+    def _shutdown(self):
+        """Releases whatever the engine holds, once its metrics have been collected."""
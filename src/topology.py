@@ -1,51 +1,198 @@
+import logging
+from collections import namedtuple
 import networkx as nx
 import matplotlib.pyplot as plt
-from ipaddress import IPv4Interface, AddressValueError
+from .iftable import InterfaceTable, int_to_ip
+from .instrument import METRICS, timed
+
+log = logging.getLogger(__name__)
+
+# What apply_config_changes did: device names, and links as sorted (device, device) pairs.
+# A modified link is a pair that stayed adjacent but whose links' attributes changed.
+TopologyDelta = namedtuple('TopologyDelta', ['added_devices', 'removed_devices', 'modified_devices',
+                                             'added_links', 'removed_links', 'modified_links'])
+
+def index_interfaces_by_subnet(table):
+    """Buckets every addressed interface row by its network as {'a.b.c.d/len': [rows]}."""
+    return {f"{int_to_ip(network)}/{prefixlen}": rows
+            for (network, prefixlen), rows in table.subnet_index().items()}
+
+def _link_attributes(table, subnet, row1, row2):
+    """Builds the edge attributes describing one discovered link."""
+    # A link is only as fast (and can only carry frames as large) as its weakest end
+    bandwidths = [table.bandwidth[row] for row in (row1, row2) if table.bandwidth[row]]
+    mtus = [table.mtu[row] for row in (row1, row2) if table.mtu[row]]
+    return {
+        'subnet': subnet,
+        'interfaces': {table.device_name(row1): table.interface_name(row1),
+                       table.device_name(row2): table.interface_name(row2)},
+        'bandwidth': min(bandwidths) if bandwidths else None,
+        'mtu': min(mtus) if mtus else None,
+    }
+
+def _add_link(G, attrs):
+    """Adds one link to the graph, keeping parallel links distinct."""
+    (dev1_name, if1), (dev2_name, if2) = attrs['interfaces'].items()
+    # Debug level: on a large estate one line per link costs more than finding the links
+    log.debug("Found link between %s (%s) and %s (%s)", dev1_name, if1, dev2_name, if2)
+    if G.is_multigraph():
+        G.add_edge(dev1_name, dev2_name, key=attrs['subnet'], **attrs)
+    elif G.has_edge(dev1_name, dev2_name):
+        # A simple graph has one edge per device pair; record the extra link on it
+        G.edges[dev1_name, dev2_name]['links'].append(attrs)
+    else:
+        G.add_edge(dev1_name, dev2_name, links=[attrs], **attrs)
+
+def _subnet_pairs(table, rows, only=None):
+    """Yields every pair of interface rows on different devices sharing a subnet.
+
+    If only is given, pairs where neither device is in it are skipped.
+    """
+    devices = [table.device_name(row) for row in rows]
+    for i in range(len(rows)):
+        for j in range(i + 1, len(rows)):
+            dev1_name, dev2_name = devices[i], devices[j]
+            if dev1_name == dev2_name:
+                continue
+            if only is not None and dev1_name not in only and dev2_name not in only:
+                continue
+            yield rows[i], rows[j]
+
+def link_subnet(G, table, subnet, rows, only=None):
+    """Adds a link for every pair of interface rows on different devices sharing a subnet."""
+    METRICS.count('interface_pairs_compared', len(rows) * (len(rows) - 1) // 2)
+    for row1, row2 in _subnet_pairs(table, rows, only):
+        _add_link(G, _link_attributes(table, subnet, row1, row2))
+
+def _node_attributes(data):
+    # Interfaces live in the graph's InterfaceTable, not on every node
+    return {key: value for key, value in data.items() if key != 'interfaces'}
+
+@timed('topology')
+def create_topology(configs, multigraph=False):
+    """Creates a network graph and infers links from the parsed configurations.
+
+    Interfaces are loaded into one columnar InterfaceTable, kept in
+    G.graph['interfaces'], and bucketed by subnet in a single vectorized pass,
+    so links fall out of the buckets instead of comparing every pair of
+    devices. With multigraph=True, parallel links between two devices become
+    separate edges keyed by subnet; otherwise each edge keeps all of its links
+    in 'links'.
+    """
+    G = nx.MultiGraph() if multigraph else nx.Graph()
+    table = G.graph['interfaces'] = InterfaceTable.from_configs(configs)
 
-def create_topology(configs):
-    """Creates a network graph and infers links from the parsed configurations."""
-    G = nx.Graph()
-    
     # Add all devices as nodes first
     for device_name, data in configs.items():
-        G.add_node(device_name, **data)
-    
-    # Get a list of device names to iterate over
-    device_names = list(configs.keys())
-    
-    # Compare each device with every other device to find links
-    for i in range(len(device_names)):
-        for j in range(i + 1, len(device_names)):
-            dev1_name = device_names[i]
-            dev2_name = device_names[j]
-            
-            dev1_interfaces = configs[dev1_name].get('interfaces', {})
-            dev2_interfaces = configs[dev2_name].get('interfaces', {})
-
-            # Check all interface pairs between the two devices
-            for if1_name, if1_data in dev1_interfaces.items():
-                for if2_name, if2_data in dev2_interfaces.items():
-                    # Ensure both interfaces have IP and mask info
-                    if 'ip' in if1_data and 'ip' in if2_data:
-                        try:
-                            # Create network objects using the ipaddress library
-                            net1 = IPv4Interface(f"{if1_data['ip']}/{if1_data['mask']}").network
-                            net2 = IPv4Interface(f"{if2_data['ip']}/{if2_data['mask']}").network
-                            
-                            # If the networks are the same, a link exists
-                            if net1 == net2:
-                                print(f"Found link between {dev1_name} ({if1_name}) and {dev2_name} ({if2_name})")
-                                G.add_edge(dev1_name, dev2_name)
-                        except AddressValueError:
-                            # Handles cases where IP/mask might be invalid
-                            continue
+        G.add_node(device_name, **_node_attributes(data))
+
+    for subnet, rows in index_interfaces_by_subnet(table).items():
+        link_subnet(G, table, subnet, rows)
+    METRICS.gauge('devices', G.number_of_nodes())
+    METRICS.gauge('links', G.number_of_edges())
+    return G
+
+def _pair(u, v):
+    return (u, v) if u <= v else (v, u)
+
+def _pair_links(G, u, v):
+    """Returns the links between two adjacent devices as a list of attribute dicts."""
+    if G.is_multigraph():
+        return list(G[u][v].values())
+    return G[u][v]['links']
+
+def _links_key(links):
+    """Returns a comparable form of a device pair's links that ignores the order they were found in."""
+    return sorted((link['subnet'], sorted(link['interfaces'].items()), link['bandwidth'] or 0, link['mtu'] or 0)
+                  for link in links)
+
+def _replace_links(G, u, v, links):
+    """Rewrites the links of an adjacent device pair in place, so both devices keep their neighbor order."""
+    if G.is_multigraph():
+        # Add before removing, so the pair never runs out of edges and drops out of the adjacency
+        keys = {link['subnet'] for link in links}
+        for attrs in links:
+            G.add_edge(u, v, key=attrs['subnet'], **attrs)
+        G.remove_edges_from([(u, v, key) for key in list(G[u][v]) if key not in keys])
+    else:
+        data = G.edges[u, v]
+        data.clear()
+        data.update(links[0], links=list(links))
+
+@timed('topology_update')
+def apply_config_changes(G, configs, changed, removed):
+    """Patches a graph in place after some devices were added, changed or removed, and returns a TopologyDelta.
+
+    Links are re-inferred only for subnets a changed device sits on. Edges
+    whose links are the same as before are left alone and edges whose links
+    changed are rewritten in place, so a device's neighbor order, and every
+    path choice that depends on it, only moves where a link really appeared
+    or disappeared.
+    """
+    table = G.graph['interfaces']
+    changed = set(changed)
+    removed = {name for name in removed if name in G}
+    old_links = {}
+    for device_name in changed | removed:
+        if device_name in G:
+            for neighbor in G[device_name]:
+                old_links[_pair(device_name, neighbor)] = _pair_links(G, device_name, neighbor)
+
+    for device_name in removed:
+        table.remove_device(device_name)
+    for device_name in changed:
+        table.add_device(device_name, configs[device_name].get('interfaces', {}))
+    new_links = {}
+    for subnet, rows in index_interfaces_by_subnet(table).items():
+        if not any(table.device_name(row) in changed for row in rows):
+            continue
+        METRICS.count('interface_pairs_compared', len(rows) * (len(rows) - 1) // 2)
+        for row1, row2 in _subnet_pairs(table, rows, only=changed):
+            attrs = _link_attributes(table, subnet, row1, row2)
+            new_links.setdefault(_pair(table.device_name(row1), table.device_name(row2)), []).append(attrs)
+
+    G.remove_nodes_from(removed)
+    added = sorted(name for name in changed if name not in G)
+    for device_name in changed:
+        if device_name in G:
+            G.nodes[device_name].clear()
+            G.nodes[device_name].update(_node_attributes(configs[device_name]))
+        else:
+            G.add_node(device_name, **_node_attributes(configs[device_name]))
+
+    removed_links = sorted(old_links.keys() - new_links.keys())
+    if G.is_multigraph():
+        # A (u, v) pair would only remove one of a multigraph's parallel links; remove them all by key
+        G.remove_edges_from([(u, v, key) for u, v in removed_links if G.has_edge(u, v) for key in list(G[u][v])])
+    else:
+        G.remove_edges_from([pair for pair in removed_links if G.has_edge(*pair)])
+    added_links, modified_links = [], []
+    for pair, links in sorted(new_links.items()):
+        if pair not in old_links:
+            added_links.append(pair)
+            for attrs in links:
+                _add_link(G, attrs)
+        elif _links_key(links) != _links_key(old_links[pair]):
+            modified_links.append(pair)
+            _replace_links(G, *pair, links)
+    return TopologyDelta(added, sorted(removed), sorted(changed.difference(added)), added_links, removed_links,
+                         modified_links)
+
+def update_topology(G, configs, changed, removed):
+    """Patches an existing graph in place after some devices were added, changed or removed.
+
+    Only the changed and removed devices' nodes and edges are touched; see
+    apply_config_changes.
+    """
+    apply_config_changes(G, configs, changed, removed)
     return G
 
-def draw_topology(graph):
+@timed('draw')
+def draw_topology(graph, path="topology.png"):
     """Saves a visual representation of the graph."""
     plt.figure(figsize=(12, 8))
     pos = nx.spring_layout(graph, seed=42)
     nx.draw(graph, pos, with_labels=True, node_color='skyblue', node_size=2500, font_size=10, font_weight='bold')
     plt.title("Generated Network Topology")
-    plt.savefig("topology.png")
-    print("Topology saved to topology.png")
\ No newline at end of file
+    plt.savefig(path)
+    log.info("Topology saved to %s", path)
@@ -1,107 +1,160 @@
-from ipaddress import IPv4Interface, IPv4Address
+import logging
+import numpy as np
+from .iftable import int_to_ip, ip_to_int, prefix_mask
+from .instrument import METRICS, timed
+
+log = logging.getLogger(__name__)
+
+def build_validation_index(graph):
+    """Precomputes the lookups every check shares from the graph's InterfaceTable.
+
+    - shared_ips: IP string -> devices configured with it, for IPs on more than one interface
+    - connected: device -> set of directly connected (network, prefix length) integer pairs
+    """
+    table = graph.graph['interfaces']
+    index = {'shared_ips': _shared_ips(table), 'connected': {device_name: set() for device_name in graph.nodes()}}
+    for row in table.addressed_rows().tolist():
+        index['connected'].setdefault(table.device_name(row), set()).add(table.network(row))
+    return index
+
+def _shared_ips(table, devices=None):
+    """Returns {IP string: devices configured with it} for IPs on more than one interface.
+
+    With devices, only IPs configured on one of those devices are looked at.
+    """
+    rows = table.addressed_rows()
+    _, ips, _ = table.columns()
+    ips = ips[rows]
+    if devices is not None:
+        own = [row for device_name in devices for row in table.rows_of(device_name) if table.is_addressed(row)]
+        candidates = np.isin(ips, np.frombuffer(table.ip, dtype=np.uint32)[own])
+        rows, ips = rows[candidates], ips[candidates]
+    shared = {}
+    # Only rows whose address occurs more than once need a per-row look in Python
+    _, inverse, counts = np.unique(ips, return_inverse=True, return_counts=True)
+    for row in rows[counts[inverse] > 1].tolist():
+        shared.setdefault(int_to_ip(table.ip[row]), []).append(table.device_name(row))
+    return shared
+
+def _report_duplicate_ips(duplicate_ips):
+    log.warning("[FAIL] Duplicate IP addresses found:")
+    for ip, devices in duplicate_ips.items():
+        log.warning("  - IP %s is used by: %s", ip, ', '.join(devices),
+                    extra={'check': 'duplicate_ips', 'ip': ip, 'devices': devices})
+
+def _report_mtu_mismatches(mtu_mismatches):
+    log.warning("[FAIL] MTU mismatches found:")
+    for (d1, i1, m1), (d2, i2, m2) in mtu_mismatches:
+        log.warning("  - %s(%s) MTU is %s, but %s(%s) MTU is %s", d1, i1, m1, d2, i2, m2,
+                    extra={'check': 'mtu_mismatches', 'interfaces': [[d1, i1, m1], [d2, i2, m2]]})
+
+def _report_incorrect_gateways(gateway_errors):
+    log.warning("[FAIL] Incorrect gateway configurations found:")
+    for device, gateway in gateway_errors:
+        log.warning("  - %s's default gateway %s is not on a directly connected network.", device, gateway,
+                    extra={'check': 'incorrect_gateways', 'devices': [device], 'gateway': gateway})
+
+@timed('validate')
 def run_validation_checks(graph):
-    """Runs all validation checks and prints a report."""
-    print("\n--- Running Validation Checks ---")
-    
-    errors_found = False
-    
-    # Check for duplicate IP addresses
-    duplicate_ips = find_duplicate_ips(graph)
-    if duplicate_ips:
-        errors_found = True
-        print("[FAIL] Duplicate IP addresses found:")
-        for ip, devices in duplicate_ips.items():
-            print(f"  - IP {ip} is used by: {', '.join(devices)}")
-
-    # Check for MTU mismatches
-    mtu_mismatches = find_mtu_mismatches(graph)
-    if mtu_mismatches:
-        errors_found = True
-        print("[FAIL] MTU mismatches found:")
-        for (d1, i1, m1), (d2, i2, m2) in mtu_mismatches:
-            print(f"  - {d1}({i1}) MTU is {m1}, but {d2}({i2}) MTU is {m2}")
-    
-    # Check for incorrect gateway addresses
-    gateway_errors = find_incorrect_gateways(graph)
-    if gateway_errors:
-        errors_found = True
-        print("[FAIL] Incorrect gateway configurations found:")
-        for device, gateway in gateway_errors:
-            print(f"  - {device}'s default gateway {gateway} is not on a directly connected network.")
-
-    if not errors_found:
-        print("[PASS] No configuration issues found.")
-        
-    print("--- Validation Complete ---\n")
-
-def find_duplicate_ips(graph):
-    # ... (your existing code for this function)
-    ip_map = {}
-    duplicates = {}
-    for device_name in graph.nodes():
-        interfaces = graph.nodes[device_name].get('interfaces', {})
-        for if_name, if_data in interfaces.items():
-            if 'ip' in if_data:
-                ip = if_data['ip']
-                if ip not in ip_map:
-                    ip_map[ip] = []
-                ip_map[ip].append(device_name)
-    for ip, devices in ip_map.items():
-        if len(devices) > 1:
-            duplicates[ip] = devices
-    return duplicates
-
-def find_mtu_mismatches(graph):
-    """Finds MTU mismatches on connected interfaces."""
+    """Runs all validation checks, prints a report and returns the results.
+
+    The result maps each check name in CHECKS to what that check found; an
+    empty value means the check passed.
+    """
+    log.info("\n--- Running Validation Checks ---")
+
+    index = build_validation_index(graph)
+    results = {}
+    for name, check, report in CHECKS:
+        with METRICS.timer(f'validate.{name}'):
+            results[name] = check(graph, index)
+        METRICS.gauge(f'validation_{name}', len(results[name]))
+        if results[name]:
+            report(results[name])
+
+    if not any(results.values()):
+        log.info("[PASS] No configuration issues found.")
+
+    log.info("--- Validation Complete ---\n")
+    return results
+
+def find_duplicate_ips(graph, index=None, devices=None):
+    """Finds IP addresses configured on more than one interface.
+
+    With devices, only addresses configured on one of those devices are
+    reported, without building a full index.
+    """
+    if devices is not None:
+        return _shared_ips(graph.graph['interfaces'], devices)
+    if index is None:
+        index = build_validation_index(graph)
+    return dict(index['shared_ips'])
+
+def _edge_links(graph, devices=None):
+    """Yields (u, v, link) for every link stored on the graph's edges, or only those touching devices."""
+    for u, v, data in graph.edges(devices, data=True):
+        # Simple graphs keep parallel links in 'links'; multigraph edges are one link each
+        for link in data.get('links', [data]):
+            yield u, v, link
+
+def find_mtu_mismatches(graph, index=None, devices=None):
+    """Finds MTU mismatches on connected interfaces by walking the graph's links.
+
+    With devices, only links with an end on one of those devices are walked.
+    """
+    table = graph.graph['interfaces']
     mismatches = []
-    # In your topology builder, you'll need to store which interfaces are connected.
-    # For now, we'll find the interfaces based on shared subnets again.
-    # A better long-term solution is to store interface names on the graph edges.
-    
-    nodes = list(graph.nodes())
-    for i in range(len(nodes)):
-        for j in range(i + 1, len(nodes)):
-            d1_name, d2_name = nodes[i], nodes[j]
-            d1_data = graph.nodes[d1_name]
-            d2_data = graph.nodes[d2_name]
-            
-            for i1, i1_data in d1_data.get('interfaces', {}).items():
-                for i2, i2_data in d2_data.get('interfaces', {}).items():
-                    if 'ip' in i1_data and 'ip' in i2_data:
-                        # Check if they are in the same subnet to confirm they are linked
-                        from ipaddress import IPv4Interface
-                        net1 = IPv4Interface(f"{i1_data['ip']}/{i1_data['mask']}").network
-                        net2 = IPv4Interface(f"{i2_data['ip']}/{i2_data['mask']}").network
-
-                        if net1 == net2:
-                            mtu1 = i1_data.get('mtu')
-                            mtu2 = i2_data.get('mtu')
-                            if mtu1 is not None and mtu2 is not None and mtu1 != mtu2:
-                                mismatches.append(((d1_name, i1, mtu1), (d2_name, i2, mtu2)))
+    for d1_name, d2_name, link in _edge_links(graph, devices):
+        i1 = link['interfaces'][d1_name]
+        i2 = link['interfaces'][d2_name]
+        # An MTU of 0 in the table means none was configured
+        mtu1 = table.mtu[table.find(d1_name, i1)]
+        mtu2 = table.mtu[table.find(d2_name, i2)]
+        if mtu1 and mtu2 and mtu1 != mtu2:
+            mismatches.append(((d1_name, i1, mtu1), (d2_name, i2, mtu2)))
     return mismatches
 
-def find_incorrect_gateways(graph):
-    """Checks if a router's default gateway is on a connected subnet."""
+def find_incorrect_gateways(graph, index=None, devices=None):
+    """Checks if a router's default gateway is on a connected subnet.
+
+    With devices, only those devices are checked, reading their connected
+    networks straight from the table.
+    """
+    table = graph.graph['interfaces']
+    if devices is None:
+        if index is None:
+            index = build_validation_index(graph)
+        devices = graph.nodes()
     errors = []
-    for device_name, device_data in graph.nodes(data=True):
-        gateway_ip = device_data.get('default_gateway')
+    for device_name in devices:
+        gateway_ip = graph.nodes[device_name].get('default_gateway')
         if not gateway_ip:
             continue # No default gateway configured, so no error
 
+        if index is not None:
+            connected = index['connected'].get(device_name, set())
+        else:
+            connected = {table.network(row) for row in table.rows_of(device_name) if table.is_addressed(row)}
         is_valid_gateway = False
-        # Check all of the device's own interfaces/subnets
-        for if_data in device_data.get('interfaces', {}).values():
-            if 'ip' in if_data:
-                try:
-                    # Check if the gateway IP is in any of the connected subnets
-                    network = IPv4Interface(f"{if_data['ip']}/{if_data['mask']}").network
-                    if IPv4Address(gateway_ip) in network:
-                        is_valid_gateway = True
-                        break
-                except ValueError:
-                    continue
-        
+        try:
+            gateway = ip_to_int(gateway_ip)
+            # One set lookup per distinct prefix length instead of a scan of every interface
+            for prefixlen in {prefixlen for _, prefixlen in connected}:
+                if (gateway & prefix_mask(prefixlen), prefixlen) in connected:
+                    is_valid_gateway = True
+                    break
+        except ValueError:
+            pass
+
         if not is_valid_gateway:
             errors.append((device_name, gateway_ip))
-            
-    return errors
\ No newline at end of file
+
+    return errors
+
+# The validation pipeline: (result name, check, report printer), run in order.
+# Every check takes (graph, index=None, devices=None).
+CHECKS = [
+    ('duplicate_ips', find_duplicate_ips, _report_duplicate_ips),
+    ('mtu_mismatches', find_mtu_mismatches, _report_mtu_mismatches),
+    ('incorrect_gateways', find_incorrect_gateways, _report_incorrect_gateways),
+]
@@ -0,0 +1,182 @@
+import json
+import time
+from .cache import scan_config_files, configs_from_entries, diff_configs
+from .parser import parse_config_paths
+from .topology import create_topology, apply_config_changes
+from .validator import CHECKS, build_validation_index
+from .analyzer import SAMPLE_DEMANDS, prepare_load_model, update_load_model
+from .instrument import METRICS, quiet_logging
+
+# Seconds between scans of the config tree
+DEFAULT_INTERVAL = 2.0
+
+# A file modified less than this many seconds ago may still be being written,
+# so it is left for a later scan
+QUIET_PERIOD = 1.0
+
+# Per validation check: (its result as a set of hashable findings, the devices a
+# finding involves, the finding as JSON-friendly event fields)
+FINDINGS = {
+    'duplicate_ips': (lambda result: {(ip, tuple(sorted(devices))) for ip, devices in result.items()},
+                      lambda finding: finding[1],
+                      lambda finding: {'ip': finding[0]}),
+    'mtu_mismatches': (lambda result: {tuple(sorted(pair)) for pair in result},
+                       lambda finding: (finding[0][0], finding[1][0]),
+                       lambda finding: {'interfaces': [list(end) for end in finding]}),
+    'incorrect_gateways': (set,
+                           lambda finding: (finding[0],),
+                           lambda finding: {'gateway': finding[1]}),
+}
+
+def print_event(event):
+    """Writes an event as one line of JSON."""
+    print(json.dumps(event), flush=True)
+
+def _utilization(load, capacity):
+    if not load:
+        return 0.0
+    return load / capacity if capacity else None # None: loaded, but no known bandwidth
+
+class ConfigWatcher:
+    """Keeps a topology, its validation findings and its link loads in step with a config directory.
+
+    Each poll() rescans the tree the way the parse cache does (size and mtime,
+    then a content hash), reparses only the files that changed and patches
+    the graph with apply_config_changes. Each validation check is then re-run
+    only for the devices the change touched, and only the traffic sources
+    whose paths it can move are rerouted. Everything that changed is handed
+    to emit as an event dict with an 'event' key.
+    """
+    def __init__(self, directory, demands=None, emit=print_event, workers=None, multigraph=False,
+                 quiet_period=QUIET_PERIOD):
+        self.directory = directory
+        self.demands = SAMPLE_DEMANDS if demands is None else demands
+        self.emit = emit
+        self.workers = workers
+        self.multigraph = multigraph
+        self.quiet_period = quiet_period
+        self.entries = {}
+        self.configs = {}
+        self.graph = None
+        self.findings = {name: set() for name, _, _ in CHECKS}
+        self.model = None
+
+    def _event(self, kind, **fields):
+        return dict(event=kind, time=round(time.time(), 3), **fields)
+
+    def _scan(self):
+        """Rescans the tree and parses the files that changed and have since been left alone."""
+        entries, reparse = scan_config_files(self.directory, self.entries)
+        settled = []
+        now = time.time_ns()
+        for path in reparse:
+            if now - entries[path]['mtime_ns'] >= self.quiet_period * 1e9:
+                settled.append(path)
+            elif path in self.entries:
+                # Keep the old entry so the next scan sees the file as changed again
+                entries[path] = self.entries[path]
+            else:
+                del entries[path]
+        for path, data in parse_config_paths(settled, self.workers):
+            entries[path]['data'] = data
+        self.entries = entries
+        return configs_from_entries(entries)
+
+    def start(self):
+        """Builds the topology from scratch and emits the initial state; returns the events."""
+        started = time.perf_counter()
+        self.configs = self._scan()
+        # Their progress reports would interleave with the JSON events on stdout
+        with quiet_logging():
+            self.graph = create_topology(self.configs, multigraph=self.multigraph)
+            self.model = prepare_load_model(self.graph, self.demands)
+        index = build_validation_index(self.graph)
+        for name, check, _ in CHECKS:
+            self.findings[name] = FINDINGS[name][0](check(self.graph, index))
+        events = [self._event('snapshot', devices=self.graph.number_of_nodes(), links=self.graph.number_of_edges(),
+                              findings=sum(len(f) for f in self.findings.values()), stranded=self.model['stranded'],
+                              seconds=round(time.perf_counter() - started, 6))]
+        for name, _, _ in CHECKS:
+            events.extend(self._finding_event(name, 'new', finding) for finding in sorted(self.findings[name]))
+        events.extend(self._load_event(e) for e in range(len(self.model['index'].edges)) if self.model['loads'][e])
+        for event in events:
+            self.emit(event)
+        return events
+
+    def poll(self):
+        """Applies whatever changed in the config tree since the last scan; returns the events emitted."""
+        started = time.perf_counter()
+        configs = self._scan()
+        changed, removed = diff_configs(self.configs, configs)
+        self.configs = configs
+        if not changed and not removed:
+            return []
+        with quiet_logging():
+            delta = apply_config_changes(self.graph, configs, changed, removed)
+
+        events = [self._event('device_added', device=name) for name in delta.added_devices]
+        events += [self._event('device_removed', device=name) for name in delta.removed_devices]
+        events += [self._event('device_modified', device=name) for name in delta.modified_devices]
+        events += [self._event('link_added', link=list(pair)) for pair in delta.added_links]
+        events += [self._event('link_removed', link=list(pair)) for pair in delta.removed_links]
+        events += [self._event('link_modified', link=list(pair)) for pair in delta.modified_links]
+        events += self._revalidate(set(changed) | set(removed))
+
+        stranded = self.model['stranded']
+        for e in update_load_model(self.model, self.graph, delta):
+            index = self.model['index']
+            if index.edge_ids.get(index.edges[e]) == e: # Removed links were reported above
+                events.append(self._load_event(e))
+        if abs(self.model['stranded'] - stranded) > 1e-6: # Ignore float noise from rerouting
+            events.append(self._event('stranded', demand=self.model['stranded']))
+
+        elapsed = time.perf_counter() - started
+        METRICS.add_time('watch.update', elapsed)
+        events.append(self._event('update', changed=len(changed), removed=len(removed), seconds=round(elapsed, 6)))
+        for event in events:
+            self.emit(event)
+        return events
+
+    def _revalidate(self, touched):
+        """Re-runs every check for the touched devices and returns events for findings that came or went."""
+        events = []
+        for name, check, _ in CHECKS:
+            normalize, involves, _ = FINDINGS[name]
+            old = self.findings[name]
+            scope = set(touched)
+            if name == 'duplicate_ips':
+                # A touched device that gave up a shared address leaves the other holders to recheck
+                for finding in old:
+                    if scope.intersection(involves(finding)):
+                        scope.update(involves(finding))
+            fresh = normalize(check(self.graph, devices=[d for d in scope if d in self.graph]))
+            stale = {finding for finding in old if scope.intersection(involves(finding))}
+            if name == 'duplicate_ips':
+                # So does taking up an address others already share
+                fresh_ips = {ip for ip, _ in fresh}
+                stale.update(finding for finding in old if finding[0] in fresh_ips)
+            self.findings[name] = (old - stale) | fresh
+            events.extend(self._finding_event(name, 'resolved', finding) for finding in sorted(stale - fresh))
+            events.extend(self._finding_event(name, 'new', finding) for finding in sorted(fresh - stale))
+        return events
+
+    def _finding_event(self, name, status, finding):
+        _, involves, describe = FINDINGS[name]
+        return self._event('validation', check=name, status=status, devices=sorted(set(involves(finding))),
+                           **describe(finding))
+
+    def _load_event(self, e):
+        index, loads = self.model['index'], self.model['loads']
+        load, capacity = float(loads[e]), float(index.capacity[e])
+        return self._event('link_load', link=list(index.edges[e]), load=load, capacity=capacity,
+                           utilization=_utilization(load, capacity))
+
+    def run(self, interval=DEFAULT_INTERVAL):
+        """Emits the initial state, then polls every interval seconds until interrupted."""
+        self.start()
+        try:
+            while True:
+                time.sleep(interval)
+                self.poll()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,13 @@
+import networkx as nx
+import pytest
+from src.simulator.partition import partition_graph
+
+@pytest.mark.parametrize('nodes, parts', [(2, 3), (3, 5), (5, 7), (0, 2)])
+def test_more_parts_than_nodes_gives_one_node_per_part(nodes, parts):
+    assignment = partition_graph(nx.path_graph(nodes), parts)
+    assert sorted(assignment.values()) == list(range(nodes))
+
+def test_parts_are_balanced():
+    assignment = partition_graph(nx.grid_2d_graph(6, 6), 4)
+    sizes = [list(assignment.values()).count(part) for part in range(4)]
+    assert sizes == [9, 9, 9, 9]
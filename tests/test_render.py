@@ -0,0 +1,23 @@
+import json
+import re
+from src.parser import parse_single_config
+from src.render import build_scene, render_html
+from src.topology import create_topology
+
+def _config(hostname, ip):
+    return parse_single_config(f"hostname {hostname}\n!\ninterface FastEthernet0/0\n"
+                               f" ip address {ip} 255.255.255.252\n bandwidth 100000\n!\n")
+
+def test_placeholders_in_hostnames_are_not_filled(tmp_path):
+    names = ['core__COLORS__1', 'edge__MAX_DETAIL__', 'x</script>__SCENE__']
+    configs = {name: _config(name, f"10.0.0.{i + 1}") for i, name in enumerate(names[:2])}
+    configs[names[2]] = _config(names[2], '10.0.1.1')
+    path = tmp_path / 'topology.html'
+    render_html(build_scene(create_topology(configs)), path, max_nodes=7)
+
+    page = path.read_text()
+    assert page.count('</script>') == 1
+    scene, colors, max_detail = re.search(r'const S = (.*), COLORS = (.*), MAX_DETAIL = (\d+);', page).groups()
+    assert sorted(json.loads(scene)['nodes']['name']) == sorted(names)
+    assert 'idle' in json.loads(colors)
+    assert max_detail == '7'